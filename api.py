@@ -0,0 +1,12 @@
+"""
+API-only server: serves every endpoint and refreshes its caches after each ingest, but never
+scrapes. Pair it with one `python worker.py`:
+
+    uvicorn api:app --workers 4
+
+Selenium, pandas and the distance matrix code are never imported; langchain only on the first
+QA request.
+"""
+from main import app
+
+app.state.schedule_ingest = False
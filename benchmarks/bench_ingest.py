@@ -0,0 +1,135 @@
+"""
+Time every ingest stage on synthetic outlets, fully offline.
+
+Run from the repository root (no network, Chrome or OpenAI key needed):
+    python -m benchmarks.bench_ingest --outlets 1000,10000,100000
+
+For each size, synthetic outlets (benchmarks/synthetic.py) are rendered as recorded result pages
+and then run through:
+    scrape            replaying the recorded pages (SCRAPER_REPLAY_DIR)
+    overlaps          grid index overlap detection
+    distance matrix   compute_distance_matrix, skipped above --max-matrix outlets (it is n x n float64)
+    operating hours   preprocess_op_hours with the stub LLM (LLM_STUB) and the SQLite cache
+    persist           persist_outlet_diff of every outlet into an empty SQLite database
+    ingest_data       the whole pipeline again on the now populated database, i.e. a day without changes
+    failed region     ingest_data with one region's page unreadable, like a browser crashing mid-scrape;
+                      the run must keep the persisted data, it fails if any outlet is deleted
+
+Peak memory is the largest amount allocated through Python (including NumPy) during the stage,
+measured with tracemalloc. Tracing slows down Python-heavy stages; pass --no-memory for clean timings.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+
+def measure(name, fn, trace_memory, results):
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    value = fn()
+    elapsed = time.perf_counter() - started
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    results.append((name, elapsed, peak))
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outlets", default="1000,10000", help="comma separated outlet counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-matrix", type=int, default=5000, help="largest outlet count for the full distance matrix")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="simulated seconds per stub LLM call")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace memory")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_ingest_")
+    pages = os.path.join(workdir, "pages")
+    # must be set before the ingest modules are imported, they read their configuration at import time
+    os.environ.update({
+        "DB_CONN": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "LLM_STUB": "1",
+        "LLM_STUB_LATENCY": str(args.stub_latency),
+        "SCRAPER_REPLAY_DIR": pages,
+    })
+    os.environ.pop("DISTANCE_MATRIX_FILE_PATH", None)
+
+    from sqlmodel import Session, SQLModel, func, select
+    from benchmarks.synthetic import generate_outlets, render_pages
+    from data_ingest.distance_compute import compute_distance_matrix
+    from data_ingest.html_replay import recorded_regions, region_file
+    from data_ingest.ingester import ingest_data
+    from data_ingest.outlet_diff import diff_outlets
+    from data_ingest.persist import persist_outlet_diff
+    from data_ingest.preprocess_op_hours import preprocess_op_hours
+    from data_ingest.scrapper import iter_replayed_outlets
+    from data_ingest.spatial_index import compute_overlapping_outlets
+    from db import engine
+    from models.models import Outlet
+
+    reports = []
+    try:
+        for n in [int(size) for size in args.outlets.split(",")]:
+            SQLModel.metadata.drop_all(engine)
+            SQLModel.metadata.create_all(engine)
+            shutil.rmtree(pages, ignore_errors=True)
+            render_pages(generate_outlets(n, args.seed), pages)
+            trace = not args.no_memory
+            results = []
+
+            outlets = measure("scrape (replay)", lambda: list(iter_replayed_outlets(pages)), trace, results)
+            overlaps = measure("overlaps", lambda: compute_overlapping_outlets(outlets), trace, results)
+            if n <= args.max_matrix:
+                measure("distance matrix", lambda: compute_distance_matrix(outlets), trace, results)
+            hours = measure("operating hours", lambda: preprocess_op_hours(outlets), trace, results)
+
+            def persist():
+                with Session(engine) as session:
+                    persist_outlet_diff(session, diff_outlets(outlets, {}), overlaps, hours)
+                    session.commit()
+            measure("persist", persist, trace, results)
+            measure("ingest_data (unchanged)", ingest_data, trace, results)
+
+            def failed_region():
+                with Session(engine) as session:
+                    before = session.exec(select(func.count()).select_from(Outlet)).one()
+                # a directory in place of the page makes reading it raise, as a failed region does
+                page = region_file(pages, recorded_regions(pages)[0])
+                os.remove(page)
+                os.mkdir(page)
+                try:
+                    updated = ingest_data()
+                finally:
+                    os.rmdir(page)
+                with Session(engine) as session:
+                    after = session.exec(select(func.count()).select_from(Outlet)).one()
+                if updated or after != before:
+                    raise AssertionError(f"A failed region changed the data: {before} outlets before, {after} after")
+            measure("failed region", failed_region, trace, results)
+
+            reports.append((n, len(overlaps), results))
+    finally:
+        if args.keep:
+            print(f"Working directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    for n, overlap_count, results in reports:
+        print(f"\n{n} outlets, {overlap_count} overlapping pairs")
+        print(f"  {'stage':<26}{'time':>10}{'peak memory':>14}")
+        for name, elapsed, peak in results:
+            memory = f"{peak:.1f} MB" if peak is not None else "-"
+            print(f"  {name:<26}{elapsed:>9.2f}s{memory:>14}")
+        if n > args.max_matrix:
+            print(f"  distance matrix skipped, above --max-matrix {args.max_matrix}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark the compiled week schedule against checking every outlet's hours in Python.
+
+Run from the repository root:
+    python -m benchmarks.bench_open_at --sizes 1000 10000 100000
+
+Operating hours are drawn from synthetic outlets (overnight, round-the-clock and public
+holiday hours included) and both lookups are run at the same random instants, so the
+comparison doubles as a correctness check: any disagreement is reported.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from index.opening_hours import DAYS, PUBLIC_HOLIDAY, WeekSchedule, day_interval
+
+# (open, close) per day, as "HH:MM", with how often each appears
+HOURS = [
+    (("10:00", "22:00"), 0.55),
+    (("08:00", "23:00"), 0.15),
+    (("07:00", "02:00"), 0.1),  # overnight
+    (("00:00", "00:00"), 0.05),  # around the clock
+    (None, 0.15),  # closed
+]
+
+
+def random_hours(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    choices, weights = zip(*HOURS)
+    hours = {}
+    for position in range(n):
+        days = {}
+        for key in DAYS + [PUBLIC_HOLIDAY]:
+            choice = rng.choices(choices, weights)[0]
+            if choice and (key != PUBLIC_HOLIDAY or rng.random() < 0.3):
+                days[key] = tuple(datetime.strptime(value, "%H:%M").time() for value in choice)
+        hours[position] = days
+    return hours
+
+
+def python_is_open(days: dict, when: datetime, public_holiday: bool) -> bool:
+    """The per-outlet check the index did before hours were compiled"""
+    minute = when.hour * 60 + when.minute
+    today = PUBLIC_HOLIDAY if public_holiday and PUBLIC_HOLIDAY in days else DAYS[when.weekday()]
+    if today in days:
+        start, end = day_interval(*days[today])
+        if start <= minute < end:
+            return True
+    yesterday = DAYS[(when.weekday() - 1) % 7]
+    if yesterday in days:
+        start, end = day_interval(*days[yesterday])
+        if minute + 24 * 60 < end:
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    monday = datetime(2024, 1, 1)
+    instants = [(monday + timedelta(minutes=rng.randrange(7 * 24 * 60)), rng.random() < 0.2) for _ in range(args.lookups)]
+
+    print(f"{'n':>8} {'intervals':>10} {'compile':>9} {'python loop':>12} {'compiled':>10} {'speedup':>8} {'mismatches':>11}")
+    for n in args.sizes:
+        hours = random_hours(n)
+        started = time.perf_counter()
+        schedule = WeekSchedule.compile(n, hours)
+        compile_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        expected = [{p for p, days in hours.items() if python_is_open(days, when, holiday)} for when, holiday in instants]
+        loop_us = (time.perf_counter() - started) / len(instants) * 1e6
+
+        schedule.open_at(*instants[0])  # warm up
+        started = time.perf_counter()
+        actual = [schedule.open_at(when, holiday) for when, holiday in instants]
+        compiled_us = (time.perf_counter() - started) / len(instants) * 1e6
+
+        mismatches = sum(set(a.tolist()) != e for a, e in zip(actual, expected))
+        print(f"{n:>8} {len(schedule.start):>10} {compile_seconds:>8.2f}s {loop_us:>10.0f}us "
+              f"{compiled_us:>8.0f}us {loop_us / compiled_us:>7.0f}x {mismatches:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Latency of the outlet snapshot's read paths against the database queries they replace.
+
+Run from the repository root:
+    python -m benchmarks.bench_outlet_index --outlets 10000 --queries 2000
+
+Synthetic outlets are written to a throwaway SQLite database and the snapshot is loaded from it.
+Reported per lookup, p50 and p99 in microseconds, including building the response rows:
+nearest 5 outlets (k-d tree vs. a distance to every outlet), a city-sized map viewport (sorted
+latitudes vs. a SQL range query), a page of 100 outlets (slice vs. SQL LIMIT/OFFSET) and a
+search for 10 outlets by name or address (trigram index vs. a SQL LIKE scan, which does not
+tolerate typos).
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, List
+
+
+def percentiles(run: Callable[[int], object], queries: int) -> List[float]:
+    import numpy as np
+    timings = []
+    for n in range(queries):
+        started = time.perf_counter()
+        run(n)
+        timings.append(time.perf_counter() - started)
+    return [float(np.percentile(timings, q)) * 1e6 for q in (50, 99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outlets", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_outlet_index_")
+    # must be set before the app modules are imported, they read their configuration at import time
+    os.environ.update({"DB_CONN": f"sqlite:///{os.path.join(workdir, 'bench.db')}", "LLM_STUB": "1"})
+
+    import numpy as np
+    from sqlmodel import Session, SQLModel, select
+    from benchmarks.synthetic import generate_outlets
+    from data_ingest.distance_compute import pairwise_distances
+    from data_ingest.outlet_diff import diff_outlets
+    from data_ingest.persist import persist_outlet_diff
+    from db import engine
+    from index.outlet_index import FIELDS, MAP_FIELDS, OutletIndex
+    from models.models import Outlet
+
+    try:
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            persist_outlet_diff(session, diff_outlets(generate_outlets(args.outlets), {}), [], [])
+            session.commit()
+
+        started = time.perf_counter()
+        index = OutletIndex.load()
+        print(f"{len(index)} outlets, snapshot loaded in {time.perf_counter() - started:.2f}s")
+
+        rng = np.random.default_rng(0)
+        # around Kuala Lumpur, where most synthetic outlets are
+        points = np.column_stack((rng.normal(3.1, 0.15, args.queries), rng.normal(101.65, 0.15, args.queries)))
+        viewports = [(lat - 0.05, lon - 0.05, lat + 0.05, lon + 0.05) for lat, lon in points]
+        pages = rng.integers(0, max(1, len(index) - 100), args.queries)
+        columns = [getattr(Outlet, name) for name in FIELDS]
+        # a city, a street with a typo and a name with an outlet number
+        searches = ["kuala lumpur", "jalan tun razk", "subway petaling jaya 12", "cheras", "shah alam"]
+
+        def scan_nearest(n):
+            distances = pairwise_distances([points[n][0]], [points[n][1]], index.lat, index.lon, "haversine")[0]
+            return [index.project(int(i)) for i in np.argsort(distances)[:5]]
+
+        with Session(engine) as session:
+            results = {
+                "nearest 5, full scan": percentiles(scan_nearest, args.queries),
+                "nearest 5, k-d tree": percentiles(
+                    lambda n: [index.project(int(i)) for i in index.nearest_positions(*points[n], 5)[0]], args.queries),
+                "viewport, SQL": percentiles(lambda n: session.exec(select(*columns).where(
+                    Outlet.latitude.between(viewports[n][0], viewports[n][2]),
+                    Outlet.longitude.between(viewports[n][1], viewports[n][3]),
+                )).all(), args.queries),
+                # as served by /outlets/bbox, at most its default limit of 500 outlets
+                "viewport, snapshot": percentiles(
+                    lambda n: [index.project(i, MAP_FIELDS) for i in index.viewport(*viewports[n], 500)[0]], args.queries),
+                "page of 100, SQL": percentiles(
+                    lambda n: session.exec(select(*columns).offset(int(pages[n])).limit(100)).all(), args.queries),
+                "page of 100, snapshot": percentiles(
+                    lambda n: [index.project(i) for i in range(pages[n], pages[n] + 100)], args.queries),
+                "search, SQL LIKE": percentiles(lambda n: session.exec(select(*columns).where(
+                    Outlet.name.contains(searches[n % len(searches)])
+                    | Outlet.address.contains(searches[n % len(searches)])
+                ).limit(10)).all(), args.queries),
+                "search, trigram index": percentiles(
+                    lambda n: [index.project(i) for i, _, _ in index.search_matches(searches[n % len(searches)])],
+                    args.queries),
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"  {'lookup':<24}{'p50':>10}{'p99':>10}")
+    for name, (p50, p99) in results.items():
+        print(f"  {name:<24}{p50:>8.0f}us{p99:>8.0f}us")
+
+
+if __name__ == "__main__":
+    main()
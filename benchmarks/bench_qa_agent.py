@@ -0,0 +1,147 @@
+"""
+Compare QA agent turns and latency with and without the pre-baked schema context.
+
+Run from the repository root (no network or OpenAI key needed):
+    python -m benchmarks.bench_qa_agent --outlets 500 --repeat 5
+
+The real agent graph, tools and SQLite database are used; only the chat model is replaced by a
+scripted one that behaves like gpt-4o does with each prompt: when the schema is not in its
+instructions it lists the tables and reads their schema before writing a query, then checks
+the query, runs it and answers. Every model call sleeps for --latency seconds plus
+--latency-per-1k seconds per thousand prompt characters, so the larger pre-baked prompt is
+not free. Reported per configuration: model turns per answer (agent turns plus the query
+checker's own call), SQL statements per answer, and p50/p95 answer latency.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from typing import List, Optional
+
+# question, SQL the scripted model writes for it (SQLite dialect)
+QUESTIONS = [
+    ("How many outlets are there?", "SELECT COUNT(id) FROM outlet"),
+    ("Which outlet closes the latest on Friday?",
+     "SELECT o.name, h.fri_close FROM outlet o JOIN outletoperatinghours h ON h.outlet_id = o.id "
+     "ORDER BY h.fri_close DESC LIMIT 1"),
+    ("Which outlets open the earliest on Sunday?",
+     "SELECT o.name, h.sun_open FROM outlet o JOIN outletoperatinghours h ON h.outlet_id = o.id "
+     "WHERE h.sun_open IS NOT NULL ORDER BY h.sun_open LIMIT 5"),
+    ("Which outlet overlaps with the most other outlets?",
+     "SELECT o.name, COUNT(*) AS overlaps FROM outlet o JOIN overlappingoutlet v "
+     "ON v.outlet1_id = o.id OR v.outlet2_id = o.id GROUP BY o.id ORDER BY overlaps DESC LIMIT 1"),
+    ("How many outlets are in Klang?", "SELECT COUNT(id) FROM outlet WHERE address LIKE '%Klang%'"),
+    ("When was the outlet data last updated?", "SELECT timestamp FROM latestupdatedtimestamp"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outlets", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.4, help="seconds per model call")
+    parser.add_argument("--latency-per-1k", type=float, default=0.01, help="seconds per 1k prompt characters")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_qa_agent_")
+    # must be set before the app modules are imported, they read their configuration at import time
+    os.environ.update({"DB_CONN": f"sqlite:///{os.path.join(workdir, 'bench.db')}", "LLM_STUB": "1"})
+
+    from datetime import datetime
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+    from sqlalchemy import event
+    from sqlmodel import Session, SQLModel
+    from benchmarks.synthetic import generate_outlets
+    from data_ingest.outlet_diff import diff_outlets
+    from data_ingest.persist import persist_outlet_diff
+    from data_ingest.preprocess_op_hours import preprocess_op_hours
+    from data_ingest.spatial_index import compute_overlapping_outlets
+    from db import engine
+    from llm.llm import build_qa_agent
+    from models.models import LatestUpdatedTimestamp
+
+    counts = {"turns": 0, "statements": 0}
+
+    def count_statement(*_):
+        counts["statements"] += 1
+    event.listen(engine, "before_cursor_execute", count_statement)
+    sql_by_question = dict(QUESTIONS)
+
+    class ScriptedModel(BaseChatModel):
+        """Plays the agent's side of the conversation for the questions in QUESTIONS"""
+        latency: float
+        latency_per_1k: float
+
+        @property
+        def _llm_type(self) -> str:
+            return "scripted"
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+        def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+            counts["turns"] += 1
+            time.sleep(self.latency + self.latency_per_1k * sum(len(str(m.content)) for m in messages) / 1000)
+            return ChatResult(generations=[ChatGeneration(message=self.reply(messages))])
+
+        def reply(self, messages) -> AIMessage:
+            system = next((m.content for m in messages if isinstance(m, SystemMessage)), "")
+            question = next((m.content for m in messages if isinstance(m, HumanMessage)), "")
+            if question not in sql_by_question:
+                # the query checker's own prompt: answer with the query unchanged
+                return AIMessage(content=next(sql for sql in sql_by_question.values() if sql in question))
+
+            sql = sql_by_question[question]
+            done = {m.name for m in messages if isinstance(m, ToolMessage)}
+            baked = "Table Definitions and Sample Rows" in system
+            steps = [] if baked else [("sql_db_list_tables", {"tool_input": ""}),
+                                      ("sql_db_schema", {"table_names": "outlet, outletoperatinghours"})]
+            steps += [("sql_db_query_checker", {"query": sql}), ("sql_db_query", {"query": sql})]
+            for name, arguments in steps:
+                if name not in done:
+                    return AIMessage(content="", tool_calls=[{"name": name, "args": arguments, "id": f"call-{name}"}])
+            result = next(m.content for m in reversed(messages) if isinstance(m, ToolMessage) and m.name == "sql_db_query")
+            return AIMessage(content=f"The answer is {result}")
+
+    try:
+        SQLModel.metadata.create_all(engine)
+        outlets = generate_outlets(args.outlets)
+        overlaps = compute_overlapping_outlets(outlets)
+        hours = preprocess_op_hours(outlets)
+        with Session(engine) as session:
+            persist_outlet_diff(session, diff_outlets(outlets, {}), overlaps, hours)
+            session.add(LatestUpdatedTimestamp(timestamp=datetime.now().isoformat()))
+            session.commit()
+
+        model = ScriptedModel(latency=args.latency, latency_per_1k=args.latency_per_1k)
+        results = {}
+        for prebaked in (False, True):
+            agent = build_qa_agent(model, prebaked_schema=prebaked)
+            latencies, turn_counts, statement_counts = [], [], []
+            for _ in range(args.repeat):
+                for question, _ in QUESTIONS:
+                    before = dict(counts)
+                    started = time.perf_counter()
+                    agent.invoke({"messages": [HumanMessage(content=question)]})
+                    latencies.append(time.perf_counter() - started)
+                    turn_counts.append(counts["turns"] - before["turns"])
+                    statement_counts.append(counts["statements"] - before["statements"])
+            results["pre-baked schema" if prebaked else "schema tools"] = (latencies, turn_counts, statement_counts)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{len(QUESTIONS)} questions x {args.repeat}, {args.latency}s + {args.latency_per_1k}s/1k chars per model call")
+    print(f"  {'configuration':<20}{'turns':>8}{'SQL':>8}{'p50':>9}{'p95':>9}")
+    for name, (latencies, turn_counts, statement_counts) in results.items():
+        p50 = statistics.median(latencies)
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"  {name:<20}{statistics.mean(turn_counts):>8.1f}{statistics.mean(statement_counts):>8.1f}"
+              f"{p50:>8.2f}s{p95:>8.2f}s")
+
+
+if __name__ == "__main__":
+    main()
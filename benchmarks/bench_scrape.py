@@ -0,0 +1,54 @@
+"""
+Compare per-outlet extraction time of the two scraper extraction modes on the live outlet finder.
+
+Run from the repository root (needs Chrome and network access):
+    python -m benchmarks.bench_scrape --search "kuala lumpur" --repeat 3
+
+Both modes read the same loaded result page, so only the extraction itself is timed. The
+records they produce are compared field by field.
+"""
+import argparse
+import time
+
+from data_ingest.scrapper import build_outlets, create_driver, extractors, search_outlets
+
+FIELDS = ["id", "name", "address", "latitude", "longitude", "operating_hours", "waze_link"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--search", default="kuala lumpur")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-headless", action="store_true")
+    args = parser.parse_args()
+
+    driver = create_driver(headless=not args.no_headless)
+    try:
+        search_outlets(driver, args.search)
+
+        outlets = {}
+        for mode, extract in extractors.items():
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                records = extract(driver)
+                timings.append(time.perf_counter() - start)
+            outlets[mode] = build_outlets(records)
+            best = min(timings)
+            print(f"{mode:>10}: {len(records)} outlets in {best:.2f}s "
+                  f"({best / max(len(records), 1) * 1000:.1f} ms per outlet, best of {args.repeat})")
+    finally:
+        driver.quit()
+
+    script, webdriver = outlets["script"], outlets["webdriver"]
+    mismatches = [
+        (a.name, name) for a, b in zip(script, webdriver) for name in FIELDS if getattr(a, name) != getattr(b, name)
+    ]
+    if len(script) != len(webdriver) or mismatches:
+        print(f"Records differ: {len(script)} vs {len(webdriver)} outlets, mismatched fields: {mismatches[:10]}")
+    else:
+        print(f"Both modes produced the same {len(script)} records")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Cold start time and resident memory of the server entry points.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup --outlets 1000 --runs 5
+
+Synthetic outlets are written to a throwaway SQLite database. Every run is a fresh interpreter:
+    import    importing the entry point's modules
+    ready     import plus the app's startup (schema check, outlet snapshot, scheduler), i.e.
+              until the worker can answer requests
+    process   wall time from spawning the interpreter to ready
+    rss       peak resident memory at ready
+"main.py (eager)" also imports the QA agent and ingest modules up front, as main.py used to.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+# (label, modules to import, module whose app is started)
+ENTRY_POINTS = [
+    ("api.py", ["api"], "api"),
+    ("main.py", ["main"], "main"),
+    ("main.py (eager)", ["llm.llm", "data_ingest.ingester", "main"], "main"),
+    ("worker.py", ["worker"], None),
+]
+
+CHILD = """
+import asyncio, contextlib, importlib, json, resource, sys, time
+started = time.perf_counter()
+for module in {modules!r}:
+    importlib.import_module(module)
+imported = time.perf_counter()
+app_module = {app_module!r}
+if app_module:
+    import main
+    app = importlib.import_module(app_module).app
+
+    async def boot():
+        async with contextlib.asynccontextmanager(main.app_lifespan)(app):
+            pass
+
+    asyncio.run(boot())
+ready = time.perf_counter()
+try:
+    # ru_maxrss survives exec, it would report the benchmark's own peak
+    with open("/proc/self/status") as status:
+        rss_kb = next(int(line.split()[1]) for line in status if line.startswith("VmHWM:"))
+except OSError:
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"import": imported - started, "ready": ready - started, "rss_mb": rss_kb / 1024}}))
+"""
+
+
+def run_once(modules: List[str], app_module: Optional[str], env: Dict[str, str]) -> dict:
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(modules=modules, app_module=app_module)],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    # the child exits right after printing, its shutdown is not part of the start
+    result["process"] = time.perf_counter() - started
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outlets", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = {
+        **os.environ,
+        "DB_CONN": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "LLM_STUB": "1",
+        "PYTHONPATH": os.getcwd(),
+    }
+    os.environ.update(env)
+
+    from sqlmodel import Session, SQLModel
+    from benchmarks.synthetic import generate_outlets
+    from data_ingest.ingester import update_timestamp
+    from data_ingest.outlet_diff import diff_outlets
+    from data_ingest.persist import persist_outlet_diff
+    from db import engine
+
+    try:
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            persist_outlet_diff(session, diff_outlets(generate_outlets(args.outlets), {}), [], [])
+            # fresh data, so the leader does not start a catch-up scrape
+            update_timestamp(session)
+            session.commit()
+
+        results = {}
+        for label, modules, app_module in ENTRY_POINTS:
+            runs = [run_once(modules, app_module, env) for _ in range(args.runs)]
+            # medians, the first run also pays for cold file caches
+            results[label] = {key: sorted(run[key] for run in runs)[len(runs) // 2] for key in runs[0]}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.outlets} outlets, median of {args.runs} runs")
+    print(f"  {'entry point':<20}{'import':>10}{'ready':>10}{'process':>10}{'rss':>10}")
+    for label, result in results.items():
+        print(f"  {label:<20}{result['import']:>9.2f}s{result['ready']:>9.2f}s"
+              f"{result['process']:>9.2f}s{result['rss_mb']:>7.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
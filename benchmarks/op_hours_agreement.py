@@ -0,0 +1,66 @@
+"""
+Check that the rule-based operating hours parser agrees with the LLM on the descriptions it accepts.
+
+Run from the repository root (needs OPENAI_API_KEY):
+    python -m benchmarks.op_hours_agreement
+
+Every corpus entry the parser accepts is also sent to the LLM, and any field on which the two
+disagree is reported. Entries the parser rejects are listed, since those always go to the LLM.
+"""
+import sys
+from data_ingest.op_hours_parser import parse_operating_hours
+from data_ingest.preprocess_op_hours import TIME_FIELDS
+from llm.preprocess_data import OutletOperatingHoursDescription, preprocess_data
+
+# Formats seen on subway.com.my, plus variants the parser is expected to handle or reject
+CORPUS = [
+    "Monday - Friday, 8:00 AM – 6:30 PM; Saturday, Sunday & Public Holiday, 8:00 AM – 3:00 PM",
+    "Monday - Sunday, 10:00 AM - 10:00 PM",
+    "Monday - Sunday, 8:00 AM - 10:00 PM",
+    "Monday - Sunday, 7:00 AM - 9:00 PM",
+    "Monday - Saturday, 8:00 AM - 9:00 PM\nSunday & Public Holiday, 9:00 AM - 6:00 PM",
+    "Monday - Friday, 7:30 AM - 8:00 PM\nSaturday, 8:00 AM - 5:00 PM",
+    "Monday - Thursday, 10:00 AM - 10:00 PM\nFriday - Sunday, 10:00 AM - 12:00 AM",
+    "Monday - Sunday, 10:00 AM - 2:00 AM",
+    "Sunday - Thursday, 8:00 AM - 11:00 PM; Friday & Saturday, 8:00 AM - 1:00 AM",
+    "Monday, Wednesday & Friday, 9:00 AM - 5:00 PM",
+    "Mon - Fri, 7:00 AM - 7:00 PM",
+    "Daily, 08:00 - 22:00",
+    "Monday - Sunday, 24 hours",
+    "Monday - Friday, 8:00 AM - 3:00 PM, 5:00 PM - 10:00 PM",
+    "Monday - Sunday, 10:00 AM - 10:00 PM (Closed on Public Holiday)",
+    "Temporarily closed",
+]
+
+
+def main() -> int:
+    texts = {f"corpus-{i}": text for i, text in enumerate(CORPUS)}
+    parsed = {outlet_id: parse_operating_hours(outlet_id, text) for outlet_id, text in texts.items()}
+    accepted = {outlet_id: record for outlet_id, record in parsed.items() if record is not None}
+
+    for outlet_id, record in parsed.items():
+        if record is None:
+            print(f"rejected (LLM only): {texts[outlet_id]!r}")
+
+    descriptions = [
+        OutletOperatingHoursDescription(outlet_id=outlet_id, operating_hours=texts[outlet_id])
+        for outlet_id in accepted
+    ]
+    llm_records = {record.outlet_id: record for record in preprocess_data(descriptions)}
+
+    disagreements = 0
+    for outlet_id, record in accepted.items():
+        llm_record = llm_records.get(outlet_id)
+        fields = [name for name in TIME_FIELDS if llm_record is None or getattr(record, name) != getattr(llm_record, name)]
+        if fields:
+            disagreements += 1
+            print(f"disagree on {fields}: {texts[outlet_id]!r}")
+            for name in fields:
+                print(f"    {name}: parser={getattr(record, name)} llm={getattr(llm_record, name, None)}")
+
+    print(f"{len(accepted)}/{len(CORPUS)} accepted by the parser, {disagreements} disagreement(s) with the LLM")
+    return 1 if disagreements else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
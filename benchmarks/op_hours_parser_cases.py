@@ -0,0 +1,84 @@
+"""
+Expected output of the rule-based operating hours parser for known formats, checked offline.
+
+Run from the repository root:
+    python -m benchmarks.op_hours_parser_cases
+
+Each case is a description and the hours the parser must return for it, or None when it must
+leave the description to the LLM (split shifts, "24 hours", closures, ...).
+"""
+import sys
+from typing import Dict, List, Optional, Tuple
+from data_ingest.op_hours_parser import DAYS, PUBLIC_HOLIDAY, parse_operating_hours
+
+WEEKDAYS = DAYS[:5]
+# not imported from preprocess_op_hours, which needs a database connection
+TIME_FIELDS = [f"{day}_{edge}" for day in DAYS + [PUBLIC_HOLIDAY] for edge in ("open", "close")]
+
+
+def hours(*spans: Tuple[List[str], str, str]) -> Dict[str, str]:
+    """Expected fields for (days, open, close) spans"""
+    fields = {}
+    for days, opening, closing in spans:
+        for day in days:
+            fields[f"{day}_open"] = opening
+            fields[f"{day}_close"] = closing
+    return fields
+
+
+CASES: List[Tuple[str, Optional[Dict[str, str]]]] = [
+    ("Monday - Friday, 8:00 AM – 6:30 PM; Saturday, Sunday & Public Holiday, 8:00 AM – 3:00 PM",
+     hours((WEEKDAYS, "08:00", "18:30"), (["sat", "sun", PUBLIC_HOLIDAY], "08:00", "15:00"))),
+    ("Monday - Sunday, 10:00 AM - 10:00 PM", hours((DAYS, "10:00", "22:00"))),
+    ("Monday - Saturday, 8:00 AM - 9:00 PM\nSunday & Public Holiday, 9:00 AM - 6:00 PM",
+     hours((DAYS[:6], "08:00", "21:00"), (["sun", PUBLIC_HOLIDAY], "09:00", "18:00"))),
+    # closing after midnight
+    ("Monday - Sunday, 10:00 AM - 2:00 AM", hours((DAYS, "10:00", "02:00"))),
+    ("Monday - Thursday, 10:00 AM - 10:00 PM\nFriday - Sunday, 10:00 AM - 12:00 AM",
+     hours((DAYS[:4], "10:00", "22:00"), (DAYS[4:], "10:00", "00:00"))),
+    # a day range wrapping around the end of the week
+    ("Sunday - Thursday, 8:00 AM - 11:00 PM; Friday & Saturday, 8:00 AM - 1:00 AM",
+     hours((["sun", "mon", "tue", "wed", "thu"], "08:00", "23:00"), (["fri", "sat"], "08:00", "01:00"))),
+    ("Monday, Wednesday & Friday, 9:00 AM - 5:00 PM", hours((["mon", "wed", "fri"], "09:00", "17:00"))),
+    ("Mon - Fri, 7:00 AM - 7:00 PM", hours((WEEKDAYS, "07:00", "19:00"))),
+    ("Daily, 08:00 - 22:00", hours((DAYS, "08:00", "22:00"))),
+    ("Monday to Friday, 7.30am to 8.00pm", hours((WEEKDAYS, "07:30", "20:00"))),
+    # split shifts
+    ("Monday - Friday, 8:00 AM - 3:00 PM, 5:00 PM - 10:00 PM", None),
+    ("Monday - Friday, 8:00 AM - 3:00 PM; Monday - Friday, 5:00 PM - 10:00 PM", None),
+    ("Monday - Sunday, 24 hours", None),
+    ("Monday - Sunday, 10:00 AM - 10:00 PM (Closed on Public Holiday)", None),
+    ("Temporarily closed", None),
+    # ambiguous or invalid times
+    ("Monday - Sunday, 10 - 10", None),
+    ("Monday - Sunday, 13:00 PM - 10:00 PM", None),
+    ("Someday - Friday, 8:00 AM - 6:00 PM", None),
+]
+
+
+def main() -> int:
+    failures = 0
+    for i, (text, expected) in enumerate(CASES):
+        record = parse_operating_hours(f"case-{i}", text)
+        if expected is None:
+            if record is not None:
+                failures += 1
+                print(f"accepted, expected a rejection: {text!r}")
+            continue
+        if record is None:
+            failures += 1
+            print(f"rejected, expected hours: {text!r}")
+            continue
+        wrong = [name for name in TIME_FIELDS if getattr(record, name) != expected.get(name)]
+        if wrong:
+            failures += 1
+            print(f"wrong {wrong}: {text!r}")
+            for name in wrong:
+                print(f"    {name}: parsed={getattr(record, name)} expected={expected.get(name)}")
+
+    print(f"{len(CASES) - failures}/{len(CASES)} cases passed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
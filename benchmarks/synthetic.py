@@ -0,0 +1,153 @@
+"""
+Synthetic outlets for offline ingest runs and benchmarks.
+
+Outlets are clustered around Malaysian population centres, weighted towards the Klang Valley,
+so the spatial index sees the same dense-core / sparse-periphery mix as the real outlet list.
+Clusters widen with the outlet count, keeping density constant instead of packing 100k outlets
+into today's city centres.
+Operating hours are drawn from formats seen on subway.com.my, including some the rule-based
+parser rejects. Generation is deterministic for a given seed; 100k outlets take a few seconds,
+mostly spent constructing the Outlet models.
+
+    python -m benchmarks.synthetic --outlets 5000 --pages replay/
+"""
+import argparse
+import html
+import math
+import os
+import numpy as np
+from typing import Dict, List
+
+from data_ingest.html_replay import region_file
+from data_ingest.scrapper import data_class_name, location_list_id, outlet_id
+from models.models import Outlet
+
+# (area, latitude, longitude, spread in km, share of outlets)
+CLUSTERS = [
+    ("Kuala Lumpur", 3.1478, 101.6953, 4.0, 0.22),
+    ("Petaling Jaya", 3.1073, 101.6067, 3.5, 0.12),
+    ("Subang Jaya", 3.0567, 101.5851, 3.0, 0.08),
+    ("Shah Alam", 3.0733, 101.5185, 5.0, 0.07),
+    ("Klang", 3.0449, 101.4456, 5.0, 0.05),
+    ("Cheras", 3.0851, 101.7434, 4.0, 0.06),
+    ("Putrajaya", 2.9264, 101.6964, 4.0, 0.04),
+    ("George Town", 5.4141, 100.3288, 5.0, 0.08),
+    ("Johor Bahru", 1.4927, 103.7414, 6.0, 0.09),
+    ("Ipoh", 4.5975, 101.0901, 5.0, 0.05),
+    ("Melaka", 2.1896, 102.2501, 5.0, 0.05),
+    ("Kota Kinabalu", 5.9804, 116.0735, 6.0, 0.04),
+    ("Kuching", 1.5533, 110.3592, 6.0, 0.05),
+]
+
+# (description, share of outlets); the last few are rejected by the parser and go to the LLM
+OPERATING_HOURS = [
+    ("Monday - Sunday, 10:00 AM - 10:00 PM", 0.30),
+    ("Monday - Sunday, 8:00 AM - 10:00 PM", 0.15),
+    ("Monday - Sunday, 7:00 AM - 9:00 PM", 0.10),
+    ("Monday - Friday, 8:00 AM – 6:30 PM\nSaturday, Sunday & Public Holiday, 8:00 AM – 3:00 PM", 0.10),
+    ("Monday - Saturday, 8:00 AM - 9:00 PM\nSunday & Public Holiday, 9:00 AM - 6:00 PM", 0.08),
+    ("Monday - Thursday, 10:00 AM - 10:00 PM\nFriday - Sunday, 10:00 AM - 12:00 AM", 0.07),
+    ("Sunday - Thursday, 8:00 AM - 11:00 PM\nFriday & Saturday, 8:00 AM - 1:00 AM", 0.05),
+    ("Monday - Sunday, 24 hours", 0.05),
+    ("Monday - Sunday, 10:00 AM - 10:00 PM (Closed on Public Holiday)", 0.04),
+    ("Monday - Friday, 8:00 AM - 3:00 PM, 5:00 PM - 10:00 PM", 0.03),
+    (None, 0.03),
+]
+
+STREETS = ["Jalan Ampang", "Jalan Bukit Bintang", "Jalan Tun Razak", "Jalan SS 15/4", "Persiaran Multimedia",
+           "Jalan Sultan Ismail", "Lebuh Chulia", "Jalan Wong Ah Fook", "Jalan Sultan Idris Shah", "Jalan Hang Tuah"]
+
+KM_PER_DEG = 111.32
+
+# Outlet count at which the cluster spreads above apply. Larger sets spread out further, so
+# outlet density (and the number of overlaps per outlet) stays about the same as n grows.
+REFERENCE_OUTLETS = 1000
+
+
+def generate_outlets(n: int, seed: int = 0) -> List[Outlet]:
+    """`n` outlets with unique IDs, clustered around CLUSTERS"""
+    rng = np.random.default_rng(seed)
+    weights = np.array([cluster[4] for cluster in CLUSTERS])
+    cluster = rng.choice(len(CLUSTERS), size=n, p=weights / weights.sum())
+    centre_lat = np.array([c[1] for c in CLUSTERS])[cluster]
+    centre_lon = np.array([c[2] for c in CLUSTERS])[cluster]
+    spread = np.array([c[3] for c in CLUSTERS])[cluster] * max(1.0, math.sqrt(n / REFERENCE_OUTLETS))
+
+    # gaussian around the centre, with a long tail of suburban outlets
+    radius = np.abs(rng.standard_t(4, size=n)) * spread
+    angle = rng.uniform(0, 2 * math.pi, size=n)
+    lat = centre_lat + radius * np.sin(angle) / KM_PER_DEG
+    lon = centre_lon + radius * np.cos(angle) / (KM_PER_DEG * np.cos(np.radians(centre_lat)))
+
+    hours_weights = np.array([hours[1] for hours in OPERATING_HOURS])
+    hours = rng.choice(len(OPERATING_HOURS), size=n, p=hours_weights / hours_weights.sum())
+    street = rng.integers(len(STREETS), size=n)
+    number = rng.integers(1, 300, size=n)
+
+    outlets = []
+    for k in range(n):
+        area = CLUSTERS[cluster[k]][0]
+        name = f"Subway {area} {k + 1}"
+        latitude, longitude = f"{lat[k]:.6f}", f"{lon[k]:.6f}"
+        outlets.append(Outlet(
+            id=outlet_id(name, latitude, longitude),
+            name=name,
+            address=f"{number[k]}, {STREETS[street[k]]}, {area}",
+            operating_hours=OPERATING_HOURS[hours[k]][0],
+            waze_link=f"https://www.waze.com/live-map/directions?to=ll.{latitude}%2C{longitude}",
+            latitude=latitude,
+            longitude=longitude,
+        ))
+    return outlets
+
+
+def area_of(outlet: Outlet) -> str:
+    return outlet.name[len("Subway "):].rsplit(" ", 1)[0]
+
+
+def render_card(outlet: Outlet) -> str:
+    lines = [outlet.address or ""] + (outlet.operating_hours or "").split("\n")
+    paragraphs = "".join(f"<p>{html.escape(line)}</p>" for line in lines)
+    google = f"https://www.google.com/maps?q={outlet.latitude},{outlet.longitude}"
+    return (
+        f'<div class="{data_class_name}" data-latitude="{outlet.latitude}" data-longitude="{outlet.longitude}">'
+        f"<h4>{html.escape(outlet.name)}</h4>"
+        f'<div class="infoboxcontent">{paragraphs}</div>'
+        f'<div class="directionButton"><a href="{html.escape(google)}">Google Maps</a>'
+        f'<a href="{html.escape(outlet.waze_link)}">Waze</a></div>'
+        "</div>\n"
+    )
+
+
+def render_pages(outlets: List[Outlet], directory: str) -> Dict[str, int]:
+    """Write one result page per area in the outlet finder's markup, for SCRAPER_REPLAY_DIR"""
+    areas: Dict[str, List[Outlet]] = {}
+    for outlet in outlets:
+        areas.setdefault(area_of(outlet), []).append(outlet)
+
+    os.makedirs(directory, exist_ok=True)
+    for area, members in areas.items():
+        # the finder keeps cards of other searches in the list, hidden
+        hidden = render_card(members[0]).replace(f'class="{data_class_name}"',
+                                                 f'class="{data_class_name}" style="display: none;"', 1)
+        with open(region_file(directory, area), "w", encoding="utf-8") as f:
+            f.write(f'<html><body><div id="{location_list_id}">\n')
+            f.write(hidden.replace(members[0].name, f"{members[0].name} (hidden)"))
+            f.writelines(render_card(outlet) for outlet in members)
+            f.write("</div></body></html>\n")
+    return {area: len(members) for area, members in areas.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outlets", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pages", required=True, help="directory to write the replay pages to")
+    args = parser.parse_args()
+
+    pages = render_pages(generate_outlets(args.outlets, args.seed), args.pages)
+    print(f"Wrote {len(pages)} pages with {sum(pages.values())} outlets to {args.pages}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import threading
+from typing import Any, Callable, List, Optional
+from metrics import Collected
+
+# Callbacks run whenever ingest commits a new generation of outlet data
+_invalidation_callbacks: List[Callable[[], None]] = []
+_response_caches: List["ResponseCache"] = []
+# Ingest timestamp of the data the caches were last invalidated for, see leader.py
+_generation: Optional[str] = None
+
+
+def on_invalidate(callback: Callable[[], None]) -> Callable[[], None]:
+    """Register a callback that drops in-process state derived from the outlet tables"""
+    _invalidation_callbacks.append(callback)
+    return callback
+
+
+def caches_generation() -> Optional[str]:
+    return _generation
+
+
+def set_caches_generation(generation: Optional[str]):
+    """Record the generation the caches are about to be built from, without invalidating them"""
+    global _generation
+    _generation = generation
+
+
+def invalidate_caches(generation: Optional[str] = None):
+    """Called after ingest commits, so every in-process cache rebuilds from the new data"""
+    if generation is not None:
+        set_caches_generation(generation)
+    for callback in _invalidation_callbacks:
+        # one failing rebuild must not keep the other caches serving the previous data
+        try:
+            callback()
+        except Exception as e:
+            print(f"Cache invalidation callback {getattr(callback, '__qualname__', callback)} failed: {e}")
+
+
+class ResponseCache:
+    """
+    Holds a single response built from the database. Hits do not touch the database; the entry is
+    dropped when ingest commits, and rebuilt right away when `warm` is set so the next request is a hit.
+    """
+
+    def __init__(self, build: Callable[[], Any], warm: bool = False, name: Optional[str] = None):
+        self._build = build
+        self._warm = warm
+        self.name = name or getattr(build, "__qualname__", repr(build))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._value: Optional[Any] = None
+        # bumped on every invalidation so a build that raced with an ingest is not stored
+        self._epoch = 0
+        on_invalidate(self.invalidate)
+        _response_caches.append(self)
+
+    def get(self) -> Any:
+        """Return the cached value, building it on a miss"""
+        value = self._value
+        if value is not None:
+            self.hits += 1
+            return value
+
+        with self._lock:
+            if self._value is not None:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            epoch = self._epoch
+            value = self._build()
+            if epoch == self._epoch:
+                self._value = value
+            return value
+
+    def invalidate(self):
+        self._epoch += 1
+        self._value = None
+        if self._warm:
+            self.get()
+
+
+Collected(
+    "response_cache_requests_total", "ResponseCache lookups by result", "counter",
+    lambda: {key: value for cache in _response_caches
+             for key, value in (((cache.name, "hit"), cache.hits), ((cache.name, "miss"), cache.misses))},
+    ("cache", "result")
+)
@@ -0,0 +1,155 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Generic, List, Optional, TypeVar
+from metrics import LLM_RETRIES
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class BatchMetrics:
+    batches: int = 0  # batch calls attempted, including retries and halves
+    retries: int = 0  # retries after a rate limit
+    splits: int = 0  # failing batches split in half
+    wall_time: float = 0.0
+    # both waits are summed over batches, so they can exceed the wall time
+    rate_limit_wait: float = 0.0  # time spent backing off after rate limits
+    concurrency_wait: float = 0.0  # time spent waiting for a free concurrency slot
+
+    def summary(self) -> str:
+        return (f"{self.batches} batch calls, {self.retries} rate limit retries, {self.splits} splits, "
+                f"{self.wall_time:.1f}s wall time, {self.rate_limit_wait:.1f}s waiting on the rate limiter, "
+                f"{self.concurrency_wait:.1f}s waiting for a concurrency slot")
+
+
+@dataclass
+class BatchResult(Generic[T, R]):
+    results: List[R] = field(default_factory=list)
+    failed: List[T] = field(default_factory=list)  # items that still failed after retries and splitting
+    metrics: BatchMetrics = field(default_factory=BatchMetrics)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """openai.RateLimitError and any other HTTP 429"""
+    return type(error).__name__ == "RateLimitError" or getattr(error, "status_code", None) == 429
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, if it said so"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncBatchExecutor(Generic[T, R]):
+    """
+    Runs `call` over items in batches with a bounded number of concurrent calls.
+
+    - Batches are packed greedily up to `max_batch_tokens` (as measured by `size`) and `max_batch_items`.
+    - A rate limit pauses every worker, then the batch is retried with exponential backoff and jitter.
+    - Any other failure splits the batch in half and retries each half, down to single items.
+    - Items that still fail are returned in `failed` instead of failing the whole run.
+
+    Concurrent runs on the same event loop share the concurrency limit and the rate limit pause,
+    so one executor bounds every call it makes, whichever run it belongs to.
+    """
+
+    def __init__(
+        self,
+        call: Callable[[List[T]], Awaitable[List[R]]],
+        size: Callable[[T], int] = lambda item: 1,
+        max_concurrency: int = 4,
+        max_batch_tokens: int = 8000,
+        max_batch_items: int = 50,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        name: str = "batch",
+    ):
+        self.call = call
+        self.size = size
+        self.max_concurrency = max_concurrency
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_items = max_batch_items
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # labels the retries in /metrics
+        self.name = name
+        # per event loop, asyncio primitives cannot be shared between loops
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # monotonic time before which no call may start, pushed forward by rate limits
+        self._resume_at = 0.0
+
+    def make_batches(self, items: List[T]) -> List[List[T]]:
+        batches, batch, tokens = [], [], 0
+        for item in items:
+            item_tokens = self.size(item)
+            if batch and (tokens + item_tokens > self.max_batch_tokens or len(batch) >= self.max_batch_items):
+                batches.append(batch)
+                batch, tokens = [], 0
+            batch.append(item)
+            tokens += item_tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def run(self, items: List[T]) -> BatchResult[T, R]:
+        result = BatchResult()
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        semaphore = self._semaphore
+
+        started = time.perf_counter()
+        await asyncio.gather(*(self._run_batch(batch, semaphore, result) for batch in self.make_batches(items)))
+        result.metrics.wall_time = time.perf_counter() - started
+        return result
+
+    async def _run_batch(self, batch: List[T], semaphore: asyncio.Semaphore, result: BatchResult):
+        metrics = result.metrics
+        for attempt in range(self.max_retries + 1):
+            waited = time.perf_counter()
+            async with semaphore:
+                metrics.concurrency_wait += time.perf_counter() - waited
+
+                # honour a pause started by a rate limit on any batch
+                pause = self._resume_at - time.monotonic()
+                if pause > 0:
+                    metrics.rate_limit_wait += pause
+                    await asyncio.sleep(pause)
+
+                metrics.batches += 1
+                try:
+                    result.results.extend(await self.call(batch))
+                    return
+                except Exception as error:
+                    if not is_rate_limited(error) or attempt == self.max_retries:
+                        failure = error
+                        break
+                    delay = retry_after(error) or min(self.max_delay, self.base_delay * 2 ** attempt)
+                    delay *= 1 + random.random() * 0.25
+                    self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                    metrics.retries += 1
+                    LLM_RETRIES.inc(call=self.name)
+                    print(f"Rate limited, backing off {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+
+        # split the failing batch and retry each half on its own
+        if len(batch) > 1:
+            metrics.splits += 1
+            middle = len(batch) // 2
+            await asyncio.gather(
+                self._run_batch(batch[:middle], semaphore, result),
+                self._run_batch(batch[middle:], semaphore, result),
+            )
+        else:
+            print(f"Batch item failed: {failure}")
+            result.failed.extend(batch)
@@ -1,36 +1,134 @@
-import pandas as pd
-from geopy.distance import geodesic
-from typing import List
-from models.models import Outlet, OverlappingOutlet
+import os
+import numpy as np
+from typing import TYPE_CHECKING, Iterator, List, Tuple
+from models.models import Outlet
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Mean earth radius in kilometers (IUGG), used by the spherical haversine formula
+EARTH_RADIUS_KM = 6371.0088
+
+# WGS-84 ellipsoid in kilometers, the same ellipsoid geopy's geodesic uses by default
+WGS84_A = 6378.137
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+# "ellipsoidal" (vectorized Vincenty on WGS-84, matches geopy's geodesic) or "haversine" (spherical, ~10x faster)
+DISTANCE_METHOD = os.getenv("DISTANCE_METHOD", "ellipsoidal")
+
+# Upper bound on the number of cells computed per block, keeps temporaries at a few tens of MB
+BLOCK_CELLS = 4_000_000
+
+
+def haversine_distance(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Great-circle distance in kilometers on a spherical earth. Inputs are in degrees and broadcast.
+
+    Differs from the ellipsoidal geodesic by at most ~0.6% (around 30 m on a 5 km catchment).
+    """
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = np.radians(lon2) - np.radians(lon1)
+
+    a = np.sin(d_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def ellipsoidal_distance(lat1, lon1, lat2, lon2, max_iter: int = 50, tol: float = 1e-12) -> np.ndarray:
+    """
+    Vincenty's inverse formula on the WGS-84 ellipsoid in kilometers. Inputs are in degrees and broadcast.
+
+    Agrees with geopy's geodesic to within 1 mm for any pair that is not nearly antipodal,
+    which covers every pair of outlets within a country.
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (lat1, lon1, lat2, lon2)))
+
+    L = np.radians(lon2 - lon1)
+    U1 = np.arctan((1 - WGS84_F) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - WGS84_F) * np.tan(np.radians(lat2)))
+    sin_u1, cos_u1 = np.sin(U1), np.cos(U1)
+    sin_u2, cos_u2 = np.sin(U2), np.cos(U2)
+
+    lam = L
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(max_iter):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt((cos_u2 * sin_lam) ** 2 + (cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam) ** 2)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+
+            # coincident points have sin_sigma == 0
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # equatorial lines have cos2_alpha == 0
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+
+            C = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+            lam_prev = lam
+            lam = L + (1 - C) * WGS84_F * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+            )
+            if np.all(np.abs(lam - lam_prev) < tol):
+                break
+
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = B * sin_sigma * (
+        cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+            - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+        )
+    )
+    return WGS84_B * A * (sigma - delta_sigma)
+
+
+DISTANCE_FUNCTIONS = {
+    "haversine": haversine_distance,
+    "ellipsoidal": ellipsoidal_distance,
+}
+
+
+def pairwise_distances(lat1, lon1, lat2, lon2, method: str = DISTANCE_METHOD) -> np.ndarray:
+    """Distance in kilometers between every point of the first set (rows) and the second set (columns)"""
+    if method not in DISTANCE_FUNCTIONS:
+        raise ValueError(f"Unknown distance method: {method}")
+    lat1, lon1 = np.asarray(lat1, dtype=float), np.asarray(lon1, dtype=float)
+    lat2, lon2 = np.asarray(lat2, dtype=float), np.asarray(lon2, dtype=float)
+    return DISTANCE_FUNCTIONS[method](lat1[:, None], lon1[:, None], lat2[None, :], lon2[None, :])
+
+
+def iter_distance_blocks(lat, lon, method: str = DISTANCE_METHOD) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yield (row offset, block) pairs covering the full distance matrix one block of rows at a time"""
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    n = len(lat)
+    rows = max(1, BLOCK_CELLS // max(n, 1))
+    for start in range(0, n, rows):
+        stop = min(start + rows, n)
+        yield start, pairwise_distances(lat[start:stop], lon[start:stop], lat, lon, method)
+
+
+def outlet_coordinates(outlets: List[Outlet]) -> Tuple[np.ndarray, np.ndarray]:
+    # scraped coordinates arrive as strings, so coerce them here; missing ones become NaN
+    lat = np.array([np.nan if outlet.latitude in (None, "") else outlet.latitude for outlet in outlets], dtype=float)
+    lon = np.array([np.nan if outlet.longitude in (None, "") else outlet.longitude for outlet in outlets], dtype=float)
+    return lat, lon
+
+
+def compute_distance_matrix(outlets: List[Outlet], method: str = DISTANCE_METHOD) -> "pd.DataFrame":
+    """Full outlet-to-outlet distance matrix in kilometers, indexed by outlet ID on both axes"""
+    # the API imports this module for its distance functions, only load pandas when a matrix is built
+    import pandas as pd
 
-def compute_distance_matrix(outlets: List[Outlet]):
     # Create a list of outlet IDs
     outlet_ids = [outlet.id for outlet in outlets]
-    
-    # Initialize an empty DataFrame for the distance matrix
-    distance_matrix = pd.DataFrame(0.0, index=outlet_ids, columns=outlet_ids)
-    overlapping_outlets = []
-    
-    for i, outlet1 in enumerate(outlets):
-        for j, outlet2 in enumerate(outlets):
-            if i < j:  # Only upper triangle (symmetric)
-                coord1 = (outlet1.latitude, outlet1.longitude)
-                coord2 = (outlet2.latitude, outlet2.longitude)
-                
-                distance = geodesic(coord1, coord2).kilometers
-                
-                # Store in DataFrame (symmetric)
-                distance_matrix.at[outlet1.id, outlet2.id] = distance
-                distance_matrix.at[outlet2.id, outlet1.id] = distance
-                
-                # check for overlapping radius catchment (5km)
-                if distance < 5.0:
-                    overlapping_outlets.append(
-                        OverlappingOutlet(
-                            outlet1_id=outlet1.id,
-                            outlet2_id=outlet2.id,
-                            distance=distance
-                        )
-                    )
-    
-    return distance_matrix, overlapping_outlets
+    lat, lon = outlet_coordinates(outlets)
+
+    # Fill the full (symmetric) matrix block by block
+    matrix = np.empty((len(outlets), len(outlets)))
+    for start, block in iter_distance_blocks(lat, lon, method):
+        matrix[start:start + len(block)] = block
+    np.fill_diagonal(matrix, 0.0)
+
+    return pd.DataFrame(matrix, index=outlet_ids, columns=outlet_ids)
@@ -0,0 +1,98 @@
+"""
+Binary outlet distance store.
+
+Layout (little endian):
+    header   8s magic | uint32 version | uint32 outlet count | uint64 byte length of the ID table
+    ids      JSON list of outlet IDs (UTF-8), zero padded to a multiple of 8 bytes
+    data     float32 condensed upper triangle, row by row: d(0,1), d(0,2), ..., d(1,2), ...
+"""
+import json
+import os
+import struct
+import threading
+import numpy as np
+from typing import List, Optional
+from data_ingest.distance_compute import DISTANCE_METHOD, iter_distance_blocks
+
+MAGIC = b"SUBWAYDM"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQ")
+
+
+def condensed_index(i: int, j: int, n: int) -> int:
+    """Position of pair (i, j), i < j, in the condensed upper triangle of an n x n matrix"""
+    return i * n - i * (i + 1) // 2 + (j - i - 1)
+
+
+def write_distance_store(path: str, outlet_ids: List[str], lat, lon, method: str = DISTANCE_METHOD):
+    """Compute all pairwise distances and write them to `path`, atomically replacing any previous store"""
+    ids = json.dumps(list(outlet_ids)).encode("utf-8")
+    ids += b"\0" * (-len(ids) % 8)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(outlet_ids), len(ids)))
+        f.write(ids)
+        # stream the upper triangle block by block, the dense matrix is never held in memory
+        for start, block in iter_distance_blocks(lat, lon, method):
+            rows = [block[k, start + k + 1:] for k in range(len(block))]
+            f.write(np.concatenate(rows).astype("<f4").tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+    # readers holding the old file keep their mapping, new readers see the complete new file
+    os.replace(tmp_path, path)
+
+
+class DistanceStore:
+    """Read-only, memory-mapped view of a distance store file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stat = os.stat(path)
+        with open(path, "rb") as f:
+            magic, version, n, ids_length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a distance store (version {VERSION})")
+            outlet_ids = json.loads(f.read(ids_length).rstrip(b"\0"))
+
+        self.n = n
+        self.index = {outlet_id: i for i, outlet_id in enumerate(outlet_ids)}
+        pairs = n * (n - 1) // 2
+        self.data = np.memmap(path, dtype="<f4", mode="r", offset=HEADER.size + ids_length, shape=(pairs,)) \
+            if pairs else np.empty(0, dtype="<f4")
+
+    def distance(self, id1: str, id2: str) -> float:
+        """Distance in kilometers between two outlets"""
+        i, j = self.index[id1], self.index[id2]
+        if i == j:
+            return 0.0
+        if i > j:
+            i, j = j, i
+        return float(self.data[condensed_index(i, j, self.n)])
+
+    def is_current(self) -> bool:
+        """Whether the file on disk is still the one this store was opened from"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size) == \
+            (self.stat.st_ino, self.stat.st_mtime_ns, self.stat.st_size)
+
+
+_store: Optional[DistanceStore] = None
+_store_lock = threading.Lock()
+
+
+def get_distance_store(path: Optional[str] = None) -> DistanceStore:
+    """Process-wide store, opened once and re-opened only when ingest has swapped in a new file"""
+    global _store
+    path = path or os.getenv("DISTANCE_MATRIX_FILE_PATH")
+    store = _store
+    if store is None or store.path != path or not store.is_current():
+        with _store_lock:
+            if _store is None or _store.path != path or not _store.is_current():
+                _store = DistanceStore(path)
+            store = _store
+    return store
@@ -0,0 +1,134 @@
+"""
+Recorded outlet finder pages, so the scraper can run without network access or Chrome.
+
+Set SCRAPER_RECORD_DIR to save the result page of every region while scraping live, and
+SCRAPER_REPLAY_DIR to read those pages back instead of starting a browser. One file per region,
+named after the search term. Cards are read the way extract_outlets_script reads them.
+"""
+import os
+import re
+from html.parser import HTMLParser
+from typing import Iterator, List, Optional, Tuple
+
+# Tags that end a line of rendered text
+BLOCK_TAGS = {"br", "p", "div", "h4", "li", "tr"}
+VOID_TAGS = {"br", "img", "input", "meta", "link", "hr", "source", "wbr"}
+
+
+def region_file(directory: str, region: str) -> str:
+    """Path of the recorded page for a search term"""
+    slug = re.sub(r"[^a-z0-9]+", "-", region.lower()).strip("-")
+    return os.path.join(directory, f"{slug}.html")
+
+
+def record_page(directory: str, region: str, html: str):
+    os.makedirs(directory, exist_ok=True)
+    with open(region_file(directory, region), "w", encoding="utf-8") as f:
+        f.write(html)
+
+
+def recorded_regions(directory: str) -> List[str]:
+    """Every recorded page in the directory, by file name"""
+    return sorted(name[:-len(".html")] for name in os.listdir(directory) if name.endswith(".html"))
+
+
+def visible_text(text: str) -> str:
+    # collapse whitespace within each line and drop empty lines, like visibleText in the script
+    lines = (re.sub(r"[ \t\r\f\v]+", " ", line.replace(" ", " ")).strip() for line in text.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+class OutletCardParser(HTMLParser):
+    """Collects the same raw records as extract_with_script from the outlet cards in a page"""
+
+    def __init__(self, card_class: str, list_id: str):
+        super().__init__(convert_charrefs=True)
+        self.card_class = card_class
+        self.list_id = list_id
+        self.records = []
+        self._stack: List[Tuple[str, set]] = []  # open tags and the roles they play
+        self._card: Optional[dict] = None
+        self._text: Optional[List[str]] = None  # text of the h4 or p being read
+
+    def _inside(self, role: str) -> bool:
+        return any(role in roles for _, roles in self._stack)
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = set((attrs.get("class") or "").split())
+        roles = set()
+
+        if tag == "div" and attrs.get("id") == self.list_id:
+            roles.add("list")
+        elif tag == "div" and self.card_class in classes and self._inside("list") and self._card is None:
+            roles.add("card")
+            hidden = "display: none" in (attrs.get("style") or "")
+            self._card = {
+                "hidden": hidden, "name": None, "paragraphs": None, "links": None,
+                "latitude": attrs.get("data-latitude"), "longitude": attrs.get("data-longitude"),
+            }
+        elif self._card is not None:
+            if tag == "h4" and self._card["name"] is None:
+                roles.add("name")
+                self._text = []
+            elif "infoboxcontent" in classes and self._card["paragraphs"] is None:
+                roles.add("info")
+                self._card["paragraphs"] = []
+            elif tag == "p" and self._inside("info"):
+                roles.add("paragraph")
+                self._text = []
+            elif "directionButton" in classes and self._card["links"] is None:
+                roles.add("direction")
+                self._card["links"] = []
+            elif tag == "a" and self._inside("direction"):
+                self._card["links"].append(attrs.get("href"))
+
+        if tag == "br" and self._text is not None:
+            self._text.append("\n")
+        if tag not in VOID_TAGS:
+            self._stack.append((tag, roles))
+
+    def handle_endtag(self, tag):
+        # pop up to the matching tag, tolerating unclosed tags
+        for depth in range(len(self._stack) - 1, -1, -1):
+            if self._stack[depth][0] == tag:
+                break
+        else:
+            return
+        while len(self._stack) > depth:
+            _, roles = self._stack.pop()
+            self._close(roles)
+        if tag in BLOCK_TAGS and self._text is not None:
+            self._text.append("\n")
+
+    def _close(self, roles: set):
+        if "name" in roles:
+            self._card["name"] = visible_text("".join(self._text))
+            self._text = None
+        elif "paragraph" in roles:
+            self._card["paragraphs"].append(visible_text("".join(self._text)))
+            self._text = None
+        elif "card" in roles:
+            card, self._card = self._card, None
+            if not card.pop("hidden"):
+                self.records.append(card)
+
+    def handle_data(self, data):
+        if self._text is not None:
+            # source line breaks are whitespace, only <br> and block ends break lines
+            self._text.append(data.replace("\n", " "))
+
+
+def extract_from_html(html: str, card_class: str, list_id: str) -> List[dict]:
+    parser = OutletCardParser(card_class, list_id)
+    parser.feed(html)
+    parser.close()
+    return parser.records
+
+
+def iter_recorded_records(directory: str, regions: Optional[List[str]], card_class: str,
+                          list_id: str) -> Iterator[Tuple[str, List[dict]]]:
+    """(region, raw records) for each recorded page, every page in the directory when no regions are given"""
+    for region in regions or recorded_regions(directory):
+        with open(region_file(directory, region), encoding="utf-8") as f:
+            yield region, extract_from_html(f.read(), card_class, list_id)
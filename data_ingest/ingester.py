@@ -1,46 +1,117 @@
 from datetime import datetime
 import os
-from sqlmodel import Session, select, text
+from sqlmodel import Session
 
-from data_ingest.distance_compute import compute_distance_matrix
-from data_ingest.preprocess_op_hours import preprocess_op_hours
-from .scrapper import scrape_data
+from data_ingest.distance_compute import outlet_coordinates
+from data_ingest.distance_store import write_distance_store
+from data_ingest.outlet_diff import load_existing_outlets
+from data_ingest.persist import (
+    SWAP_MIN_ROWS, overlap_settings_changed, pending_rows, persist_outlet_diff, swap_in_outlet_diff, write_generation
+)
+from data_ingest.pipeline import ScrapeFailed, run_pipeline
+from data_ingest.status import IngestCancelled, ingest_status
 from db import engine
-from models.models import LatestUpdatedTimestamp
+from cache import invalidate_caches
+from metrics import INGEST_RUNS, INGEST_STAGE_SECONDS
 
-def ingest_data():
-    # Scrape data
-    results = scrape_data()
-    
-    # Compute Additional Attributes
-    distance_matrix, overlapping_outlets = compute_distance_matrix(results)
-    outlets_operating_hours = preprocess_op_hours(results)
+def new_generation() -> str:
+    """The time of this ingest, which identifies the generation of data it writes"""
+    return datetime.now().isoformat()
 
-    # Persist Data
+def update_timestamp(session: Session) -> str:
+    """Record the time of this ingest in the same transaction as its data"""
+    return write_generation(session, new_generation())
+
+def ingest_data() -> bool:
+    """Scrape and persist a new generation of outlet data; False when the existing data was kept"""
+    ingest_status.set_stage("scraping")
     with Session(engine) as session:
-        # Remove existing data
-        session.exec(text('DELETE FROM overlappingoutlet'))
-        session.exec(text('DELETE FROM outletoperatinghours'))
-        session.exec(text('DELETE FROM outlet'))
-        
-        # Add new data
-        session.add_all(results)
-        session.add_all(overlapping_outlets)
-        session.add_all(outlets_operating_hours)
-
-        # Update the latest updated_at timestamp
-        latest_updated_timestamp = session.exec(select(LatestUpdatedTimestamp)).first()
-        if latest_updated_timestamp is None:
-            latest_updated_timestamp = LatestUpdatedTimestamp(timestamp=datetime.now().isoformat())
-            session.add(latest_updated_timestamp)
-        else:
-            latest_updated_timestamp.timestamp = datetime.now().isoformat()
+        existing = load_existing_outlets(session)
+        rebuild_overlaps = overlap_settings_changed(session)
+    if rebuild_overlaps and existing:
+        print("Catchment radius or distance method changed, recomputing every overlap")
+
+    # Scrape, classify against the persisted outlets, find new overlaps and normalize
+    # operating hours as one streaming pipeline
+    try:
+        result = run_pipeline(existing, stop=ingest_status.cancelled, rebuild_overlaps=rebuild_overlaps)
+    except ScrapeFailed as e:
+        # a failed scrape must not wipe the persisted outlets
+        print(f"Scrape failed, keeping existing data: {e}")
+        ingest_status.record_error(f"Scrape failed: {e}")
+        return False
+    diff = result.diff
+    if not diff.outlets:
+        print("Scrape returned no outlets, keeping existing data")
+        ingest_status.record_error("Scrape returned no outlets")
+        return False
+    print(f"Ingest: {diff.summary()}")
+    print(f"Ingest pipeline: {result.summary()}")
+    if result.without_coordinates:
+        print(f"Ingest: {len(result.without_coordinates)} outlets without coordinates, left out of overlap detection")
+    # busy time of the overlapping pipeline stages (classify includes finding overlaps), and its wall time
+    for stage, seconds in result.timings.items():
+        INGEST_STAGE_SECONDS.observe(seconds, stage="pipeline" if stage == "total" else stage)
+    overlapping_outlets = result.overlapping_outlets
+    outlets_operating_hours = result.outlets_operating_hours
 
-        session.commit()
+    # read these before the commit expires the ORM objects
+    outlet_ids = [outlet.id for outlet in diff.outlets]
+    latitudes, longitudes = outlet_coordinates(diff.outlets)
+
+    # Persist Data. Large diffs are written to shadow tables and swapped in, so readers never wait
+    # on a long write transaction; small ones are applied in place in one short transaction
+    # last point at which a cancelled ingest can stop without having written anything
+    ingest_status.check_cancelled()
+    ingest_status.set_stage("persisting")
+    with INGEST_STAGE_SECONDS.time(stage="persist"):
+        if pending_rows(diff, overlapping_outlets, outlets_operating_hours) >= SWAP_MIN_ROWS:
+            generation = new_generation()
+            stats = swap_in_outlet_diff(engine, diff, overlapping_outlets, outlets_operating_hours, generation)
+        else:
+            with Session(engine) as session:
+                stats = persist_outlet_diff(session, diff, overlapping_outlets, outlets_operating_hours)
+                generation = update_timestamp(session)
+                session.commit()
+    print(f"Persist: {stats.summary()}")
 
-        # Persist the df matrix
-        file_path = os.getenv("DISTANCE_MATRIX_FILE_PATH")
-        distance_matrix.to_csv(file_path)
+    # Drop responses built from the previous data; the other workers pick the new generation up by polling
+    ingest_status.set_stage("rebuilding caches")
+    with INGEST_STAGE_SECONDS.time(stage="rebuild_caches"):
+        invalidate_caches(generation)
 
+    # Persist the distance store, only needed by the QA agent's distance tool
+    # and only rebuilt when the set of outlets changed
+    file_path = os.getenv("DISTANCE_MATRIX_FILE_PATH")
+    if file_path and (diff.membership_changed or not os.path.exists(file_path)):
+        ingest_status.set_stage("writing distance store")
+        with INGEST_STAGE_SECONDS.time(stage="distance_store"):
+            write_distance_store(file_path, outlet_ids, latitudes, longitudes)
+    return True
 
 
+def run_ingest(trigger: str = "scheduled") -> bool:
+    """
+    Run ingest_data unless an ingest is already running in this process, recording its progress
+    and outcome for /readyz. Never raises, so it is safe as a scheduler job or background thread.
+    """
+    if not ingest_status.begin(trigger):
+        print(f"Ingest already running, skipping the {trigger} one")
+        return False
+    try:
+        updated = ingest_data()
+    except IngestCancelled as e:
+        print(f"Ingest cancelled, keeping existing data: {e}")
+        # the reason given to cancel() is recorded as the error
+        ingest_status.finish("cancelled")
+        INGEST_RUNS.inc(outcome="cancelled")
+        return False
+    except Exception as e:
+        print(f"Ingest failed: {e}")
+        ingest_status.finish("failed", str(e))
+        INGEST_RUNS.inc(outcome="failed")
+        return False
+    outcome = "updated" if updated else "kept"
+    ingest_status.finish(outcome)
+    INGEST_RUNS.inc(outcome=outcome)
+    return updated
@@ -0,0 +1,70 @@
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+from sqlalchemy import delete, or_, update
+from sqlmodel import Session, select
+from data_ingest.persist import upsert
+from llm.preprocess_data import PROMPT_VERSION, ProcessedOutletOperatingHours
+from models.models import OperatingHoursCache
+
+# Cached results not used for this many days are evicted
+CACHE_MAX_AGE_DAYS = int(os.getenv("OP_HOURS_CACHE_MAX_AGE_DAYS", "90"))
+
+
+def normalize_operating_hours(operating_hours: Optional[str]) -> str:
+    """Collapse differences that cannot change the parsed times: case, whitespace and dash style"""
+    text = re.sub(r"[–—]", "-", (operating_hours or "").lower())
+    lines = [" ".join(line.split()) for line in re.split(r"[;\n]", text)]
+    return "\n".join(line for line in lines if line)
+
+
+def cache_key(operating_hours: Optional[str], prompt_version: str = PROMPT_VERSION) -> str:
+    return hashlib.sha256(f"{prompt_version}\0{normalize_operating_hours(operating_hours)}".encode()).hexdigest()
+
+
+def lookup(session: Session, keys: Iterable[str]) -> Dict[str, dict]:
+    """Cached field values by key, refreshing the last used time of every hit"""
+    keys = list(set(keys))
+    if not keys:
+        return {}
+
+    rows = session.exec(select(OperatingHoursCache).where(OperatingHoursCache.key.in_(keys))).all()
+    hits = {row.key: json.loads(row.hours) for row in rows}
+    if hits:
+        session.execute(
+            update(OperatingHoursCache)
+            .where(OperatingHoursCache.key.in_(list(hits)))
+            .values(last_used_at=datetime.now())
+        )
+    return hits
+
+
+def store(session: Session, results: Dict[str, ProcessedOutletOperatingHours]):
+    """Cache LLM results by key; the outlet ID is not part of the cached value"""
+    now = datetime.now()
+    upsert(session, OperatingHoursCache, [
+        {
+            "key": key,
+            "prompt_version": PROMPT_VERSION,
+            "hours": record.model_dump_json(exclude={"outlet_id"}),
+            "last_used_at": now,
+        }
+        for key, record in results.items()
+    ])
+
+
+def evict(session: Session, max_age_days: int = CACHE_MAX_AGE_DAYS) -> int:
+    """Drop entries from other prompt versions and entries unused for max_age_days"""
+    result = session.execute(delete(OperatingHoursCache).where(or_(
+        OperatingHoursCache.prompt_version != PROMPT_VERSION,
+        OperatingHoursCache.last_used_at < datetime.now() - timedelta(days=max_age_days)
+    )))
+    return result.rowcount
+
+
+def clear(session: Session) -> int:
+    """Drop every cached result, e.g. after fixing a bad prompt without changing its text"""
+    return session.execute(delete(OperatingHoursCache)).rowcount
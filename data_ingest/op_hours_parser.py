@@ -0,0 +1,121 @@
+"""
+Rule-based parser for the common operating hours formats, e.g.
+
+    Monday - Friday, 8:00 AM – 6:30 PM; Saturday, Sunday & Public Holiday, 8:00 AM – 3:00 PM
+    Monday - Sunday, 10:00 AM - 10:00 PM
+
+Anything it is not certain about (unknown words, conflicting times, "24 hours", "closed", ...) is
+rejected so that the LLM handles it instead.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+from llm.preprocess_data import ProcessedOutletOperatingHours
+
+# Day keys in ProcessedOutletOperatingHours field order, Monday first
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+PUBLIC_HOLIDAY = "public_holiday"
+
+DAY_NAMES = {
+    "monday": "mon", "mon": "mon",
+    "tuesday": "tue", "tues": "tue", "tue": "tue",
+    "wednesday": "wed", "wed": "wed",
+    "thursday": "thu", "thurs": "thu", "thur": "thu", "thu": "thu",
+    "friday": "fri", "fri": "fri",
+    "saturday": "sat", "sat": "sat",
+    "sunday": "sun", "sun": "sun",
+    "public holiday": PUBLIC_HOLIDAY, "public holidays": PUBLIC_HOLIDAY, "ph": PUBLIC_HOLIDAY,
+}
+
+# Words that mean every day of the week
+EVERY_DAY = {"daily", "everyday", "every day"}
+
+DASH = r"\s*(?:-|–|—|\bto\b)\s*"
+TIME = r"(\d{1,2})(?:[:.](\d{2}))?\s*([ap])?\.?\s*(?:m\.?)?"
+TIME_RANGE = re.compile(rf"{TIME}{DASH}{TIME}", re.IGNORECASE)
+DAY_RANGE = re.compile(rf"^(.+?){DASH}(.+)$", re.IGNORECASE)
+DAY_SEPARATORS = re.compile(r"\s*(?:,|&|/|\band\b)\s*", re.IGNORECASE)
+
+
+def parse_time(hour: str, minute: Optional[str], meridiem: Optional[str]) -> Optional[str]:
+    """HH:MM in 24 hour format, or None when the time is not valid"""
+    if meridiem:
+        hour, minute = int(hour), int(minute or 0)
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem.lower() == "p" else 0)
+    elif minute is not None:
+        # 24 hour clock, e.g. 08:00 - 22:00
+        hour, minute = int(hour), int(minute)
+        if hour > 23:
+            return None
+    else:
+        # a bare hour without AM/PM is ambiguous
+        return None
+    if minute > 59:
+        return None
+    return f"{hour:02d}:{minute:02d}"
+
+
+def parse_days(text: str) -> Optional[List[str]]:
+    """Day keys named by a list such as "Monday - Friday", "Saturday, Sunday & Public Holiday" """
+    days = []
+    for token in DAY_SEPARATORS.split(text.strip(" ,:").lower()):
+        if not token:
+            continue
+        if token in DAY_NAMES:
+            days.append(DAY_NAMES[token])
+            continue
+        if token in EVERY_DAY:
+            days.extend(DAYS)
+            continue
+
+        # a range of weekdays, which may wrap around the end of the week
+        match = DAY_RANGE.match(token)
+        if not match:
+            return None
+        start, end = DAY_NAMES.get(match.group(1).strip()), DAY_NAMES.get(match.group(2).strip())
+        if start not in DAYS or end not in DAYS:
+            return None
+        i, j = DAYS.index(start), DAYS.index(end)
+        days.extend(DAYS[k % 7] for k in range(i, (j if j >= i else j + 7) + 1))
+
+    return days or None
+
+
+def parse_segment(segment: str) -> Optional[Tuple[List[str], str, str]]:
+    """(days, open, close) for one "<days>, <open> - <close>" segment"""
+    match = TIME_RANGE.search(segment)
+    if not match or segment[match.end():].strip(" .,;"):
+        return None
+
+    days = parse_days(segment[:match.start()])
+    opening = parse_time(*match.group(1, 2, 3))
+    closing = parse_time(*match.group(4, 5, 6))
+    if not days or not opening or not closing:
+        return None
+    return days, opening, closing
+
+
+def parse_operating_hours(outlet_id: str, operating_hours: Optional[str]) -> Optional[ProcessedOutletOperatingHours]:
+    """Parse an operating hours description, or return None when it needs the LLM"""
+    hours: Dict[str, Tuple[str, str]] = {}
+
+    for segment in re.split(r"[;\n]", operating_hours or ""):
+        if not segment.strip():
+            continue
+        parsed = parse_segment(segment)
+        if parsed is None:
+            return None
+
+        days, opening, closing = parsed
+        for day in days:
+            # the same day listed twice with different times is ambiguous
+            if hours.get(day, (opening, closing)) != (opening, closing):
+                return None
+            hours[day] = (opening, closing)
+
+    fields = {}
+    for day, (opening, closing) in hours.items():
+        fields[f"{day}_open"] = opening
+        fields[f"{day}_close"] = closing
+    return ProcessedOutletOperatingHours(outlet_id=outlet_id, **fields)
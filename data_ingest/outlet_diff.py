@@ -0,0 +1,77 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set
+from sqlmodel import Session, select
+from models.models import Outlet, OutletOperatingHours
+
+# Attributes that can change without changing the outlet ID (which is derived from name and coordinates)
+TRACKED_FIELDS = ("address", "operating_hours", "waze_link")
+
+
+@dataclass
+class OutletDiff:
+    """Scraped outlets classified against what is currently persisted"""
+    outlets: List[Outlet] = field(default_factory=list)  # every scraped outlet, deduplicated by ID
+    added: List[Outlet] = field(default_factory=list)
+    changed: List[Outlet] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)  # IDs
+    hours_changed: List[Outlet] = field(default_factory=list)  # added, changed or missing operating hours
+    # every overlap was recomputed and replaces the persisted ones, e.g. after the catchment radius changed
+    overlaps_rebuilt: bool = False
+    _seen: Set[str] = field(default_factory=set, repr=False)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+    @property
+    def membership_changed(self) -> bool:
+        """Whether outlets were added or removed, i.e. distances and overlaps are affected"""
+        return bool(self.added or self.removed)
+
+    def classify(self, outlet: Outlet, existing: Dict[str, dict]) -> Optional[str]:
+        """
+        Add one scraped outlet to the diff and return "added", "changed" or "unchanged",
+        or None when the outlet was already seen in this scrape
+        """
+        # the same outlet can be listed twice, keep the first listing
+        if outlet.id in self._seen:
+            return None
+        self._seen.add(outlet.id)
+        self.outlets.append(outlet)
+
+        previous = existing.get(outlet.id)
+        if previous is None:
+            self.added.append(outlet)
+            self.hours_changed.append(outlet)
+            return "added"
+
+        # outlets whose operating hours failed to normalize last time have no row, retry them
+        if outlet.operating_hours != previous["operating_hours"] or not previous.get("has_hours", True):
+            self.hours_changed.append(outlet)
+        if any(getattr(outlet, name) != previous[name] for name in TRACKED_FIELDS):
+            self.changed.append(outlet)
+            return "changed"
+        return "unchanged"
+
+    def finish(self, existing: Dict[str, dict]):
+        """Persisted outlets that were not scraped are removed"""
+        self.removed = [outlet_id for outlet_id in existing if outlet_id not in self._seen]
+
+    def summary(self) -> str:
+        return (f"{len(self.outlets)} outlets: {len(self.added)} added, {len(self.changed)} changed, "
+                f"{len(self.removed)} removed, {len(self.hours_changed)} with new operating hours")
+
+
+def load_existing_outlets(session: Session) -> Dict[str, dict]:
+    """Tracked attributes of the persisted outlets and whether they have operating hours, as plain dicts keyed by ID"""
+    rows = session.exec(select(Outlet.id, *(getattr(Outlet, name) for name in TRACKED_FIELDS))).all()
+    with_hours = set(session.exec(select(OutletOperatingHours.outlet_id).distinct()).all())
+    return {row[0]: {**dict(zip(TRACKED_FIELDS, row[1:])), "has_hours": row[0] in with_hours} for row in rows}
+
+
+def diff_outlets(scraped: Iterable[Outlet], existing: Dict[str, dict]) -> OutletDiff:
+    diff = OutletDiff()
+    for outlet in scraped:
+        diff.classify(outlet, existing)
+    diff.finish(existing)
+    return diff
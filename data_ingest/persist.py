@@ -0,0 +1,294 @@
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+from sqlalchemy import (
+    Column, ForeignKey, Integer, MetaData, Table, and_, bindparam, delete, insert, or_, select, text, tuple_, update
+)
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, SQLModel
+from data_ingest.outlet_diff import OutletDiff
+from data_ingest.distance_compute import DISTANCE_METHOD
+from data_ingest.spatial_index import CATCHMENT_RADIUS_KM
+from models.models import LatestUpdatedTimestamp, Outlet, OutletOperatingHours, OverlappingOutlet, OverlapSettings
+
+# Rows per executemany batch
+PERSIST_CHUNK_SIZE = int(os.getenv("PERSIST_CHUNK_SIZE", "5000"))
+# Diffs writing at least this many rows are applied to shadow tables and swapped in
+SWAP_MIN_ROWS = int(os.getenv("INGEST_SWAP_MIN_ROWS", "10000"))
+
+# The tables one ingest generation spans, parents first. The timestamp identifies the generation
+# and the overlap settings describe its overlaps, so they are swapped in together with the data
+SWAPPED_MODELS = [Outlet, OverlappingOutlet, OutletOperatingHours, LatestUpdatedTimestamp, OverlapSettings]
+SHADOW_SUFFIX = "__shadow"
+OLD_SUFFIX = "__old"
+
+
+@dataclass
+class PersistStats:
+    mode: str = "in place"
+    rows: int = 0  # inserted, updated, copied or deleted
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        rate = self.rows / self.seconds if self.seconds else 0
+        return f"{self.mode}: {self.rows} rows in {self.seconds:.2f}s ({rate:.0f} rows/s)"
+
+
+def live_tables() -> Dict[str, Table]:
+    return {model.__table__.name: model.__table__ for model in SWAPPED_MODELS}
+
+
+def chunks(items: Sequence, size: int = PERSIST_CHUNK_SIZE) -> Iterable[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def upsert(session: Session, model: type[SQLModel], rows: List[dict], table: Optional[Table] = None) -> int:
+    """Insert rows, updating the existing row on a primary key conflict"""
+    if not rows:
+        return 0
+
+    table = model.__table__ if table is None else table
+    primary_key = [column.name for column in table.primary_key.columns]
+    updated = [name for name in rows[0] if name not in primary_key]
+    dialect = session.get_bind().dialect.name
+
+    if dialect == "mysql":
+        statement = mysql.insert(table)
+        statement = statement.on_duplicate_key_update({name: statement.inserted[name] for name in updated})
+    elif dialect in ("sqlite", "postgresql"):
+        statement = (sqlite if dialect == "sqlite" else postgresql).insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=primary_key,
+            set_={name: statement.excluded[name] for name in updated}
+        )
+    else:
+        # no portable upsert: update the rows that exist, insert the others. Deleting and
+        # re-inserting would break the foreign keys of the rows referencing them
+        key_columns = [table.c[name] for name in primary_key]
+        statement = update(table).where(and_(*(column == bindparam(f"key_{column.name}") for column in key_columns)))
+        statement = statement.values({name: bindparam(name) for name in updated})
+        for chunk in chunks(rows):
+            keys = [tuple(row[name] for name in primary_key) for row in chunk]
+            found = set(tuple(key) for key in session.execute(select(*key_columns).where(tuple_(*key_columns).in_(keys))))
+            present = [row for row, key in zip(chunk, keys) if key in found]
+            if present and updated:
+                session.execute(statement, [{**row, **{f"key_{name}": row[name] for name in primary_key}} for row in present])
+            missing = [row for row, key in zip(chunk, keys) if key not in found]
+            if missing:
+                session.execute(insert(table), missing)
+        return len(rows)
+
+    for chunk in chunks(rows):
+        session.execute(statement, chunk)
+    return len(rows)
+
+
+def bulk_insert(session: Session, table: Table, rows: List[dict]) -> int:
+    """Core executemany in chunks, without building an ORM unit of work"""
+    for chunk in chunks(rows):
+        session.execute(insert(table), chunk)
+    return len(rows)
+
+
+def write_generation(session: Session, generation: str, table: Optional[Table] = None) -> str:
+    """Set the ingest timestamp in the live latestupdatedtimestamp table or in `table`, e.g. its shadow copy"""
+    table = LatestUpdatedTimestamp.__table__ if table is None else table
+    if not session.execute(update(table).values(timestamp=generation)).rowcount:
+        session.execute(insert(table).values(timestamp=generation))
+    return generation
+
+
+def overlap_settings_changed(session: Session) -> bool:
+    """Whether the persisted overlaps were computed with another radius or distance method, or it is not known"""
+    settings = session.execute(select(OverlapSettings.radius_km, OverlapSettings.method)).first()
+    # the radius may be stored in single precision
+    return (settings is None or settings.method != DISTANCE_METHOD
+            or not math.isclose(settings.radius_km, CATCHMENT_RADIUS_KM, rel_tol=1e-6))
+
+
+def write_overlap_settings(session: Session, table: Optional[Table] = None):
+    table = OverlapSettings.__table__ if table is None else table
+    session.execute(delete(table))
+    session.execute(insert(table).values(radius_km=CATCHMENT_RADIUS_KM, method=DISTANCE_METHOD))
+
+
+def outlet_row(outlet: Outlet) -> dict:
+    row = {column.name: getattr(outlet, column.name) for column in Outlet.__table__.columns}
+    # scraped coordinates arrive as strings
+    row["latitude"] = float(row["latitude"]) if row["latitude"] not in (None, "") else None
+    row["longitude"] = float(row["longitude"])
+    return row
+
+
+def model_rows(records: List[SQLModel]) -> List[dict]:
+    """Column values of new records, leaving out the autoincrement id"""
+    if not records:
+        return []
+    names = [column.name for column in type(records[0]).__table__.columns if column.name != "id"]
+    return [{name: getattr(record, name) for name in names} for record in records]
+
+
+def pending_rows(diff: OutletDiff, overlapping_outlets: List[dict],
+                 outlets_operating_hours: List[OutletOperatingHours]) -> int:
+    """Rows a diff inserts or replaces, not counting cascaded deletes"""
+    return (len(diff.added) + len(diff.changed) + len(diff.removed)
+            + len(overlapping_outlets) + len(outlets_operating_hours))
+
+
+def persist_outlet_diff(
+    session: Session,
+    diff: OutletDiff,
+    overlapping_outlets: List[dict],
+    outlets_operating_hours: List[OutletOperatingHours],
+    tables: Optional[Dict[str, Table]] = None
+) -> PersistStats:
+    """
+    Apply a diff: only rows of added, changed and removed outlets are written, to the live tables
+    or to `tables` (e.g. shadow copies) keyed by live table name. Overlaps are overlappingoutlet
+    rows (see spatial_index.overlap_row). Nothing is committed.
+    """
+    started = time.perf_counter()
+    tables = tables or live_tables()
+    outlet_table = tables[Outlet.__table__.name]
+    overlapping_table = tables[OverlappingOutlet.__table__.name]
+    hours_table = tables[OutletOperatingHours.__table__.name]
+    removed = diff.removed
+    stale_hours = removed + [outlet.id for outlet in diff.hours_changed]
+    rows = 0
+
+    # Remove rows that reference removed outlets (every overlap when they were all recomputed),
+    # and operating hours that are about to be replaced
+    if diff.overlaps_rebuilt:
+        rows += session.execute(delete(overlapping_table)).rowcount
+        write_overlap_settings(session, tables[OverlapSettings.__table__.name])
+    else:
+        for chunk in chunks(removed):
+            rows += session.execute(delete(overlapping_table).where(or_(
+                overlapping_table.c.outlet1_id.in_(chunk),
+                overlapping_table.c.outlet2_id.in_(chunk)
+            ))).rowcount
+    for chunk in chunks(stale_hours):
+        rows += session.execute(delete(hours_table).where(hours_table.c.outlet_id.in_(chunk))).rowcount
+    for chunk in chunks(removed):
+        rows += session.execute(delete(outlet_table).where(outlet_table.c.id.in_(chunk))).rowcount
+
+    # Add new and changed outlets, then the rows that depend on them
+    rows += upsert(session, Outlet, [outlet_row(record) for record in diff.added + diff.changed], outlet_table)
+    rows += bulk_insert(session, overlapping_table, overlapping_outlets)
+    rows += bulk_insert(session, hours_table, model_rows(outlets_operating_hours))
+    return PersistStats(rows=rows, seconds=time.perf_counter() - started)
+
+
+def copy_tables(suffix: str) -> Dict[str, Table]:
+    """Definitions of the swapped tables under `suffix`, foreign keys pointing at each other"""
+    metadata = MetaData()
+    tables = {}
+    for model in SWAPPED_MODELS:
+        table = model.__table__
+        columns = [
+            Column(
+                column.name,
+                column.type,
+                *[ForeignKey(f"{key.column.table.name}{suffix}.{key.column.name}") for key in column.foreign_keys],
+                primary_key=column.primary_key,
+                nullable=column.nullable,
+                autoincrement=column.autoincrement
+            )
+            for column in table.columns
+        ]
+        tables[table.name] = Table(table.name + suffix, metadata, *columns)
+    return tables
+
+
+def drop_tables(engine: Engine, suffix: str):
+    """Drop leftover copies, children first"""
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.begin() as connection:
+        for model in reversed(SWAPPED_MODELS):
+            connection.exec_driver_sql(f"DROP TABLE IF EXISTS {quote(model.__table__.name + suffix)}")
+
+
+def continue_sequences(session: Session, tables: Dict[str, Table]):
+    """
+    PostgreSQL: copied rows keep their ids but a new table's serial sequence starts at 1, move each
+    sequence past the copied ids so that rows inserted without one do not collide
+    """
+    quote = session.get_bind().dialect.identifier_preparer.quote
+    for table in tables.values():
+        column = table.c.get("id")
+        if column is None or not column.primary_key or not isinstance(column.type, Integer):
+            continue
+        session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence(:table, 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {quote(table.name)}"
+        ), {"table": quote(table.name)})
+
+
+def swap_tables(engine: Engine):
+    """Replace the live tables by their shadow copies in one atomic step"""
+    quote = engine.dialect.identifier_preparer.quote
+    names = [model.__table__.name for model in SWAPPED_MODELS]
+    if engine.dialect.name == "mysql":
+        # a single RENAME TABLE is atomic: readers see either every old table or every new one
+        renames = ", ".join(
+            f"{quote(name)} TO {quote(name + OLD_SUFFIX)}, {quote(name + SHADOW_SUFFIX)} TO {quote(name)}"
+            for name in names
+        )
+        with engine.connect() as connection:
+            connection.exec_driver_sql(f"RENAME TABLE {renames}")
+        return
+
+    # SQLite and PostgreSQL DDL is transactional, rename every table in one transaction
+    with engine.begin() as connection:
+        if engine.dialect.name == "sqlite":
+            # pysqlite does not open a transaction for DDL by itself
+            connection.exec_driver_sql("BEGIN")
+        for name in names:
+            connection.exec_driver_sql(f"ALTER TABLE {quote(name)} RENAME TO {quote(name + OLD_SUFFIX)}")
+            connection.exec_driver_sql(f"ALTER TABLE {quote(name + SHADOW_SUFFIX)} RENAME TO {quote(name)}")
+
+
+def swap_in_outlet_diff(
+    engine: Engine,
+    diff: OutletDiff,
+    overlapping_outlets: List[dict],
+    outlets_operating_hours: List[OutletOperatingHours],
+    generation: str
+) -> PersistStats:
+    """
+    Apply a diff to shadow copies of the outlet tables and swap them in. Readers keep querying the
+    live tables, without lock waits, until the swap, and never see them empty or half written.
+    Foreign keys follow renamed tables, so the swapped-in tables reference each other.
+    The `generation` timestamp is written to the shadow copy and becomes visible with the data.
+    """
+    started = time.perf_counter()
+    live = live_tables()
+    shadow = copy_tables(SHADOW_SUFFIX)
+    drop_tables(engine, SHADOW_SUFFIX)
+    drop_tables(engine, OLD_SUFFIX)
+    shadow_metadata = next(iter(shadow.values())).metadata
+    shadow_metadata.create_all(engine)
+
+    with Session(engine) as session:
+        # server side copy of the current generation, then the diff on top of it
+        copied = 0
+        for name, table in shadow.items():
+            if diff.overlaps_rebuilt and name == OverlappingOutlet.__table__.name:
+                # replaced as a whole, no need to copy it
+                continue
+            columns = [column.name for column in table.columns]
+            copied += session.execute(
+                insert(table).from_select(columns, select(*(live[name].c[column] for column in columns)))
+            ).rowcount
+        if engine.dialect.name == "postgresql":
+            continue_sequences(session, shadow)
+        stats = persist_outlet_diff(session, diff, overlapping_outlets, outlets_operating_hours, shadow)
+        write_generation(session, generation, shadow[LatestUpdatedTimestamp.__table__.name])
+        session.commit()
+
+    swap_tables(engine)
+    drop_tables(engine, OLD_SUFFIX)
+    return PersistStats(mode="shadow swap", rows=copied + stats.rows, seconds=time.perf_counter() - started)
@@ -0,0 +1,204 @@
+"""
+Streaming ingest pipeline.
+
+    scrape (thread) --outlets--> classify + spatial index (caller's thread) --batches--> operating hours (workers)
+
+Outlets flow through bounded queues as soon as each region is scraped, operating hours batches are
+dispatched every HOURS_BATCH_SIZE outlets and overlaps are found while the grid index is built up, so
+ingest takes about as long as its slowest stage instead of the sum of all stages. Persisting stays a
+single transaction at the end, the diff only knows which outlets were removed once the scrape is done.
+"""
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from data_ingest.outlet_diff import OutletDiff
+from data_ingest.preprocess_op_hours import LLM_MAX_CONCURRENCY, preprocess_op_hours
+from data_ingest.spatial_index import GridIndex, overlap_row
+from data_ingest.status import IngestCancelled
+from models.models import Outlet, OutletOperatingHours
+
+# Outlets per operating hours batch
+HOURS_BATCH_SIZE = int(os.getenv("HOURS_BATCH_SIZE", "50"))
+# Operating hours batches processed at the same time
+HOURS_WORKERS = int(os.getenv("HOURS_WORKERS", str(LLM_MAX_CONCURRENCY)))
+# Scraped outlets buffered ahead of the classify stage
+OUTLET_QUEUE_SIZE = 1000
+# How long to wait for the scrape and hours stages to finish once every outlet has been classified
+PIPELINE_JOIN_TIMEOUT_SECONDS = float(os.getenv("PIPELINE_JOIN_TIMEOUT_SECONDS", "1800"))
+
+_DONE = object()
+
+
+class ScrapeFailed(Exception):
+    """The scrape stage raised, nothing scraped in this run can be trusted to be complete"""
+
+
+@dataclass
+class PipelineResult:
+    diff: OutletDiff
+    overlapping_outlets: List[dict] = field(default_factory=list)  # overlap_row dicts
+    outlets_operating_hours: List[OutletOperatingHours] = field(default_factory=list)
+    without_coordinates: List[str] = field(default_factory=list)  # outlet IDs left out of overlap detection
+    timings: Dict[str, float] = field(default_factory=dict)  # busy seconds per stage, plus the total
+
+    def summary(self) -> str:
+        return ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in self.timings.items())
+
+
+def _coordinates(outlet: Outlet) -> Optional[Tuple[float, float]]:
+    # scraped coordinates arrive as strings and may be missing
+    try:
+        return float(outlet.latitude), float(outlet.longitude)
+    except (TypeError, ValueError):
+        return None
+
+
+def _put(q: queue.Queue, item, stop: threading.Event):
+    # blocks while the queue is full, but gives up once another stage has failed
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            pass
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    # blocks while the queue is empty, returns _DONE once another stage has failed
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+def run_pipeline(
+    existing: Dict[str, dict],
+    outlets: Optional[Iterable[Outlet]] = None,
+    preprocess: Callable[[List[Outlet]], List[OutletOperatingHours]] = preprocess_op_hours,
+    hours_batch_size: int = HOURS_BATCH_SIZE,
+    hours_workers: int = HOURS_WORKERS,
+    stop: Optional[threading.Event] = None,
+    rebuild_overlaps: bool = False,
+) -> PipelineResult:
+    """
+    Stream outlets from `outlets` (the live scraper by default) through diffing, overlap detection and
+    operating hours normalization against the `existing` persisted outlets. Nothing is written to the database.
+    Setting `stop` from outside makes every stage give up, and the pipeline raise IngestCancelled.
+    With `rebuild_overlaps`, every overlap is reported, not only those involving an added outlet.
+    """
+    if outlets is None:
+        from data_ingest.scrapper import iter_scraped_outlets
+        outlets = iter_scraped_outlets()
+
+    result = PipelineResult(diff=OutletDiff(overlaps_rebuilt=rebuild_overlaps))
+    timings = {"scrape": 0.0, "classify": 0.0, "hours": 0.0}
+    outlet_queue = queue.Queue(maxsize=OUTLET_QUEUE_SIZE)
+    batch_queue = queue.Queue(maxsize=2 * hours_workers)
+    stop = stop or threading.Event()
+    errors = []
+    lock = threading.Lock()
+
+    def scrape():
+        started = time.perf_counter()
+        try:
+            for outlet in outlets:
+                _put(outlet_queue, outlet, stop)
+                if stop.is_set():
+                    return
+        except Exception as e:
+            errors.append(ScrapeFailed(str(e)))
+            stop.set()
+        finally:
+            timings["scrape"] = time.perf_counter() - started
+            _put(outlet_queue, _DONE, stop)
+
+    def normalize_hours():
+        while True:
+            batch = _get(batch_queue, stop)
+            if batch is _DONE:
+                return
+            started = time.perf_counter()
+            try:
+                records = preprocess(batch)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+                return
+            with lock:
+                result.outlets_operating_hours.extend(records)
+                timings["hours"] += time.perf_counter() - started
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=scrape, name="ingest-scrape", daemon=True)] + [
+        threading.Thread(target=normalize_hours, name=f"ingest-hours-{n}", daemon=True) for n in range(hours_workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    diff = result.diff
+    index = GridIndex()
+    added = set()
+    pending = []
+    try:
+        while True:
+            outlet = _get(outlet_queue, stop)
+            if outlet is _DONE:
+                break
+
+            busy = time.perf_counter()
+            hours_changed = len(diff.hours_changed)
+            status = diff.classify(outlet, existing)
+            if status is None:
+                continue
+
+            # Coordinates are part of the outlet ID, so only pairs with an added outlet are new overlaps,
+            # unless the radius or distance method changed since the persisted ones were computed
+            if status == "added":
+                added.add(outlet.id)
+            coordinates = _coordinates(outlet)
+            if coordinates is None:
+                result.without_coordinates.append(outlet.id)
+            else:
+                for other_id, distance in index.add(outlet.id, *coordinates):
+                    if rebuild_overlaps or status == "added" or other_id in added:
+                        result.overlapping_outlets.append(overlap_row(other_id, outlet.id, distance))
+
+            if len(diff.hours_changed) > hours_changed:
+                pending.append(outlet)
+                if len(pending) >= hours_batch_size:
+                    _put(batch_queue, pending, stop)
+                    pending = []
+            timings["classify"] += time.perf_counter() - busy
+
+        if pending:
+            _put(batch_queue, pending, stop)
+    except BaseException:
+        # unblock the other stages, they are waiting on the queues this loop no longer serves
+        stop.set()
+        raise
+    finally:
+        for _ in range(hours_workers):
+            _put(batch_queue, _DONE, stop)
+        deadline = time.monotonic() + (5 if stop.is_set() else PIPELINE_JOIN_TIMEOUT_SECONDS)
+        for thread in threads:
+            # after a failure the other stages may be blocked on a queue, daemon threads do not block shutdown
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+
+    if errors:
+        raise errors[0]
+    stuck = [thread.name for thread in threads if thread.is_alive()]
+    if stuck:
+        stop.set()
+        raise RuntimeError(f"Ingest stages did not finish within {PIPELINE_JOIN_TIMEOUT_SECONDS:.0f}s: {', '.join(stuck)}")
+    if stop.is_set():
+        # no stage failed, so the stop came from outside
+        raise IngestCancelled("Ingest pipeline stopped")
+
+    diff.finish(existing)
+    result.timings = {**timings, "total": time.perf_counter() - started}
+    return result
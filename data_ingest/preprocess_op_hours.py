@@ -1,60 +1,149 @@
 from models.models import Outlet, OutletOperatingHours
-from llm.preprocess_data import OutletOperatingHoursDescription, preprocess_data
-from langchain_core.runnables import RunnableParallel, RunnableLambda
+from llm.preprocess_data import OutletOperatingHoursDescription, ProcessedOutletOperatingHours, apreprocess_data
+from data_ingest.batch_executor import AsyncBatchExecutor
+from data_ingest.op_hours_parser import parse_operating_hours
+from data_ingest import op_hours_cache
+from db import engine
+from metrics import Counter
+from sqlmodel import Session
 from datetime import time
+from functools import lru_cache
+import asyncio
+import os
+import threading
 
-def batching_outlets(outlets: list[Outlet]):
-    batches = []
-    # split the outlets into 50 per batch
-    for i in range(0, len(outlets), 50):
-        batch = outlets[i:i+50]
-        outlet_op_hours = [OutletOperatingHoursDescription(outlet_id=outlet.id, operating_hours=outlet.operating_hours) for outlet in batch]
-        batches.append(outlet_op_hours)
+# Upper bound on concurrent LLM calls
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# Token budget per LLM call, input plus the expected structured output
+LLM_MAX_BATCH_TOKENS = int(os.getenv("LLM_MAX_BATCH_TOKENS", "8000"))
+# Rough size of one ProcessedOutletOperatingHours record in the structured output
+OUTPUT_TOKENS_PER_OUTLET = 180
 
-    return batches
+OP_HOURS_CACHE_LOOKUPS = Counter(
+    "op_hours_cache_lookups_total", "Operating hours descriptions looked up in the LLM result cache", ("result",)
+)
 
-from langchain.schema.runnable import RunnableLambda, RunnableParallel
+# Time fields shared by ProcessedOutletOperatingHours and OutletOperatingHours
+TIME_FIELDS = [
+    f"{day}_{edge}"
+    for day in ["mon", "tue", "wed", "thu", "fri", "sat", "sun", "public_holiday"]
+    for edge in ["open", "close"]
+]
 
-def preprocess_op_hours(outlets: list[Outlet]) -> list[OutletOperatingHours]:
-    batches = batching_outlets(outlets)
-    jobs = {}
+@lru_cache(maxsize=1)
+def token_encoding():
+    # tiktoken may need to download its vocabulary, fall back to an estimate when it cannot
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")  # gpt-4o
+    except Exception:
+        return None
+
+def count_tokens(text: str | None) -> int:
+    encoding = token_encoding()
+    if encoding is None:
+        return len(text or "") // 4 + 1
+    return len(encoding.encode(text or ""))
+
+# Batches are sized by the tokens they need, including the structured output for every outlet
+llm_executor = AsyncBatchExecutor(
+    apreprocess_data,
+    size=lambda description: count_tokens(description.operating_hours) + OUTPUT_TOKENS_PER_OUTLET,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_batch_tokens=LLM_MAX_BATCH_TOKENS,
+    max_batch_items=50,
+    name="operating_hours",
+)
+
+_llm_loop = None
+_llm_loop_lock = threading.Lock()
+
+def llm_loop() -> asyncio.AbstractEventLoop:
+    """
+    One event loop for every LLM call of the process. The pipeline normalizes operating hours on
+    several threads; running all of their batches on this loop and through llm_executor keeps
+    LLM_MAX_CONCURRENCY and rate limit pauses process-wide instead of per thread.
+    """
+    global _llm_loop
+    with _llm_loop_lock:
+        if _llm_loop is None:
+            _llm_loop = asyncio.new_event_loop()
+            threading.Thread(target=_llm_loop.run_forever, name="llm-loop", daemon=True).start()
+    return _llm_loop
+
+def preprocess_with_llm(outlets: list[Outlet]) -> list[ProcessedOutletOperatingHours]:
+    descriptions = [OutletOperatingHoursDescription(outlet_id=outlet.id, operating_hours=outlet.operating_hours) for outlet in outlets]
+
+    result = asyncio.run_coroutine_threadsafe(llm_executor.run(descriptions), llm_loop()).result()
+
+    print(f"Operating hours LLM: {result.metrics.summary()}")
+    if result.failed:
+        # partial success: these outlets are left without structured operating hours, the next ingest retries them
+        print(f"Operating hours LLM: {len(result.failed)} outlets failed after retries")
+
+    return result.results
 
-    for i, batch in enumerate(batches):
-        runnable = RunnableLambda(lambda x, batch=batch: preprocess_data(batch))
-        jobs[f"batch{i}"] = runnable  # Store the runnable in the dictionary
+def to_outlet_operating_hours(record: ProcessedOutletOperatingHours) -> OutletOperatingHours:
+    return OutletOperatingHours(
+        outlet_id=record.outlet_id,
+        **{name: time.fromisoformat(getattr(record, name)) if getattr(record, name) else None for name in TIME_FIELDS}
+    )
 
-    # Parallel execution of jobs
-    parallel_processing_chain = RunnableParallel(jobs)
-    
-    # Invoke the parallel chain
-    batch_results = parallel_processing_chain.invoke({})
+def preprocess_with_cache(outlets: list[Outlet]) -> list[ProcessedOutletOperatingHours]:
+    keys = {outlet.id: op_hours_cache.cache_key(outlet.operating_hours) for outlet in outlets}
 
-    # Postprocess: Flatten the batch results into a single list
+    with Session(engine) as session:
+        evicted = op_hours_cache.evict(session)
+        cached = op_hours_cache.lookup(session, keys.values())
+        session.commit()
+
+    # One representative outlet per description that is not cached yet
+    misses = {}
+    for outlet in outlets:
+        if keys[outlet.id] not in cached:
+            misses.setdefault(keys[outlet.id], outlet)
+    hits = sum(keys[outlet.id] in cached for outlet in outlets)
+    OP_HOURS_CACHE_LOOKUPS.inc(hits, result="hit")
+    OP_HOURS_CACHE_LOOKUPS.inc(len(outlets) - hits, result="miss")
+    print(f"Operating hours cache: {hits}/{len(outlets)} hits, {len(misses)} distinct descriptions sent to the LLM, {evicted} evicted")
+
+    if misses:
+        # the LLM runs outside of any transaction
+        representatives = {outlet.id: key for key, outlet in misses.items()}
+        results = {representatives[record.outlet_id]: record
+                   for record in preprocess_with_llm(list(misses.values()))
+                   if record.outlet_id in representatives}
+
+        with Session(engine) as session:
+            op_hours_cache.store(session, results)
+            session.commit()
+        cached.update({key: record.model_dump(exclude={"outlet_id"}) for key, record in results.items()})
+
+    # Outlets the LLM did not return a record for are left out, as before
+    return [
+        ProcessedOutletOperatingHours(outlet_id=outlet.id, **cached[keys[outlet.id]])
+        for outlet in outlets
+        if keys[outlet.id] in cached
+    ]
+
+def preprocess_op_hours(outlets: list[Outlet]) -> list[OutletOperatingHours]:
+    # Fast path: parse the common formats without the LLM
     all_records = []
-    for batch in batch_results.values():
-        all_records.extend(batch)  # Append all records from each batch
+    unparsed = []
+    for outlet in outlets:
+        record = parse_operating_hours(outlet.id, outlet.operating_hours)
+        if record is None:
+            unparsed.append(outlet)
+        else:
+            all_records.append(record)
+
+    if outlets:
+        parsed = len(outlets) - len(unparsed)
+        print(f"Operating hours fast path: {parsed}/{len(outlets)} parsed without the LLM ({parsed / len(outlets):.0%} hit rate)")
+
+    # Only the descriptions the parser does not recognize go to the LLM, and only once per distinct description
+    if unparsed:
+        all_records.extend(preprocess_with_cache(unparsed))
 
     # parse the record to 
-    return [OutletOperatingHours(
-            outlet_id=record.outlet_id,
-            mon_open=time.fromisoformat(record.mon_open) if record.mon_open else None,
-            mon_close=time.fromisoformat(record.mon_close) if record.mon_close else None,
-            tue_open=time.fromisoformat(record.tue_open) if record.tue_open else None,
-            tue_close=time.fromisoformat(record.tue_close) if record.tue_close else None,
-            wed_open=time.fromisoformat(record.wed_open) if record.wed_open else None,
-            wed_close=time.fromisoformat(record.wed_close) if record.wed_close else None,
-            thu_open=time.fromisoformat(record.thu_open) if record.thu_open else None,
-            thu_close=time.fromisoformat(record.thu_close) if record.thu_close else None,
-            fri_open=time.fromisoformat(record.fri_open) if record.fri_open else None,
-            fri_close=time.fromisoformat(record.fri_close) if record.fri_close else None,
-            sat_open=time.fromisoformat(record.sat_open) if record.sat_open else None,
-            sat_close=time.fromisoformat(record.sat_close) if record.sat_close else None,
-            sun_open=time.fromisoformat(record.sun_open) if record.sun_open else None,
-            sun_close=time.fromisoformat(record.sun_close) if record.sun_close else None,
-            public_holiday_open=time.fromisoformat(record.public_holiday_open) if record.public_holiday_open else None,
-            public_holiday_close=time.fromisoformat(record.public_holiday_close) if record.public_holiday_close else None,
-        ) for record in all_records]
-
-
-
-    
\ No newline at end of file
+    return [to_outlet_operating_hours(record) for record in all_records]
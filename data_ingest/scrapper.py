@@ -1,4 +1,9 @@
-from uuid import uuid4
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from multiprocessing import get_context
+from multiprocessing.util import Finalize
+from uuid import NAMESPACE_URL, uuid5
+import os
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service
@@ -7,19 +12,60 @@ from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import UnexpectedAlertPresentException, NoAlertPresentException
 
+from data_ingest.html_replay import iter_recorded_records, record_page
 from models.models import Outlet
 
 url = "https://subway.com.my/find-a-subway"
+# Namespace for deterministic outlet IDs
+outlet_id_namespace = uuid5(NAMESPACE_URL, url)
 input_id = "fp_searchAddress"
 button_id = "fp_searchAddressBtn"
 data_class_name = "fp_listitem"
 search_string = "kuala lumpur"
+# Comma separated search terms to cover, e.g. "kuala lumpur,petaling jaya,johor bahru"
+search_strings = [term.strip() for term in os.getenv("SCRAPE_REGIONS", search_string).split(",") if term.strip()]
+# Number of Chrome instances (one per worker process) scraping regions in parallel
+pool_size = int(os.getenv("SCRAPER_POOL_SIZE", "4"))
 location_list_id = "fp_locationlist"
+# Save every scraped result page here, see data_ingest/html_replay.py
+record_dir = os.getenv("SCRAPER_RECORD_DIR")
+# Read recorded result pages from here instead of scraping live
+replay_dir = os.getenv("SCRAPER_REPLAY_DIR")
 
  # Define weekdays to filter operating hours
 weekdays = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
 
-def scrape_data(headless=True):
+# Extracts every visible outlet card in a single WebDriver round trip.
+# Text is read the way Selenium's WebElement.text reads it: only rendered text, whitespace collapsed per line.
+extract_outlets_script = """
+const visibleText = (el) => {
+    if (!el || !el.getClientRects().length) return "";
+    return el.innerText.replace(/\\u00a0/g, " ").split("\\n")
+        .map((line) => line.replace(/[ \\t]+/g, " ").trim())
+        .filter((line) => line).join("\\n");
+};
+return Array.from(document.querySelectorAll(arguments[0]))
+    .filter((el) => !el.style.cssText.includes("display: none"))
+    .map((el) => {
+        const title = el.querySelector("h4");
+        const info = el.querySelector(".infoboxcontent");
+        const direction = el.querySelector(".directionButton");
+        return {
+            name: title ? visibleText(title) : null,
+            paragraphs: info ? Array.from(info.querySelectorAll("p")).map(visibleText) : null,
+            latitude: el.getAttribute("data-latitude"),
+            longitude: el.getAttribute("data-longitude"),
+            links: direction ? Array.from(direction.querySelectorAll("a")).map((a) => a.href) : null,
+        };
+    });
+"""
+
+@lru_cache(maxsize=1)
+def resolve_driver_path():
+    """Path of the chromedriver binary, resolved (and downloaded if needed) once per process"""
+    return os.getenv("CHROMEDRIVER_PATH") or ChromeDriverManager().install()
+
+def create_driver(headless=True, driver_path=None):
     # Set up Chrome Web Driver options
     options = webdriver.ChromeOptions()
     if headless:
@@ -27,91 +73,220 @@ def scrape_data(headless=True):
     options.add_argument("--log-level=1")
 
     # Initialize WebDriver
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-    
+    return webdriver.Chrome(service=Service(driver_path or resolve_driver_path()), options=options)
+
+def search_outlets(driver, search_string=search_string):
+    """Runs a search on the outlet finder and waits for the result list"""
+    # Open the website
+    driver.get(url)
+
+    # Wait for the input field and enter search text
+    wait = WebDriverWait(driver, 10)
+    input_field = wait.until(EC.presence_of_element_located((By.ID, input_id)))
+    input_field.clear()  # Clear any existing text
+    input_field.send_keys(search_string)  # Enter the search query
+
+    # Wait for the search button and click it
+    search_button = wait.until(EC.element_to_be_clickable((By.ID, button_id)))
+    search_button.click()
+
+    # Handle any alerts
+    handle_alert(driver)
+
+    # Wait for the results to appear
+    wait.until(EC.presence_of_element_located((By.CLASS_NAME, data_class_name)))
+
+def extract_with_script(driver):
+    """Raw outlet records from one execute_script call"""
+    return driver.execute_script(extract_outlets_script, f"#{location_list_id} div.{data_class_name}")
+
+def extract_with_webdriver(driver):
+    """Raw outlet records read element by element, about 10 WebDriver round trips per outlet"""
+    elements = [element for element in driver.find_elements(By.XPATH, "//div[@id='{}']//div[contains(@class, '{}')]".format(location_list_id, data_class_name)) if "display: none" not in element.get_attribute("style")]
+    records = []
+
+    for element in elements:
+        try:
+            info = element.find_element(By.CLASS_NAME, "infoboxcontent")
+            records.append({
+                "name": element.find_element(By.TAG_NAME, "h4").text,
+                "paragraphs": [p.text for p in info.find_elements(By.TAG_NAME, "p")],
+                "latitude": element.get_attribute("data-latitude"),
+                "longitude": element.get_attribute("data-longitude"),
+                "links": [a.get_attribute("href") for a in element.find_element(By.CLASS_NAME, "directionButton").find_elements(By.TAG_NAME, "a")],
+            })
+
+        except UnexpectedAlertPresentException:
+            handle_alert(driver)
+
+        except Exception as e:
+            print(f"Skipping element: {e}")
+
+    return records
+
+def build_outlet(record):
+    """Builds an Outlet from a raw record produced by either extraction mode"""
+    if record["name"] is None or record["paragraphs"] is None or record["links"] is None:
+        raise ValueError(f"incomplete outlet card for {record['name']!r}")
+    if not record["paragraphs"]:
+        raise ValueError(f"no details for {record['name']!r}")
+
+    # handle empty address
+    address = record["paragraphs"][0] or None
+
+    # Extract operating hours by checking for weekday names
+    operating_hours = [text for text in record["paragraphs"] if any(day in text for day in weekdays)]
+
+    # Allow empty operating hours if none are found
+    if not operating_hours:
+        operating_hours = None
+    else:
+        # Join the operating hours into a single string with newlines
+        operating_hours = "\n".join(operating_hours)
+
+    # Extract Waze link
+    if len(record["links"]) < 2:
+        raise ValueError(f"no Waze link for {record['name']!r}")
+    waze_link = fix_duplicated_link(record["links"][1])
+
+    return Outlet(
+        id = outlet_id(record["name"], record["latitude"], record["longitude"]),
+        name=record["name"],
+        address=address,
+        operating_hours=operating_hours,
+        waze_link=waze_link,
+        latitude=record["latitude"],
+        longitude=record["longitude"]
+    )
+
+def build_outlets(records):
+    results = []
+    for record in records:
+        try:
+            results.append(build_outlet(record))
+        except Exception as e:
+            print(f"Skipping element: {e}")
+    print(f"Extracted {len(results)}/{len(records)} outlets")
+    return results
+
+extractors = {
+    "script": extract_with_script,
+    "webdriver": extract_with_webdriver,
+}
+
+# State of a scraper worker process: one driver, reused for every region the process is given
+_worker = {}
+
+def _init_worker(driver_path, headless, extraction, record_dir=None):
+    _worker.update(driver_path=driver_path, headless=headless, extraction=extraction, record_dir=record_dir, driver=None)
+
+def _worker_driver():
+    if _worker["driver"] is None:
+        driver = create_driver(_worker["headless"], _worker["driver_path"])
+        _worker["driver"] = driver
+        # quit Chrome when the worker process exits
+        _worker["finalizer"] = Finalize(driver, driver.quit, exitpriority=10)
+    return _worker["driver"]
+
+class RegionScrapeFailed(Exception):
+    """A region could not be scraped; its outlets are unknown, not absent"""
+
+def _scrape_region(region):
+    """Runs in a worker process and returns raw records, which pickle cheaply. Raises RegionScrapeFailed."""
     try:
-        # Open the website
-        driver.get(url)
-
-        # Wait for the input field and enter search text
-        wait = WebDriverWait(driver, 10)
-        input_field = wait.until(EC.presence_of_element_located((By.ID, input_id)))
-        input_field.clear()  # Clear any existing text
-        input_field.send_keys(search_string)  # Enter the search query
-
-        # Wait for the search button and click it
-        search_button = wait.until(EC.element_to_be_clickable((By.ID, button_id)))
-        search_button.click()
-
-        # Handle any alerts
-        handle_alert(driver)
-
-        # Wait for the results to appear
-        wait.until(EC.presence_of_element_located((By.CLASS_NAME, data_class_name)))
-
-         # Extract data
-        elements = [element for element in driver.find_elements(By.XPATH, "//div[@id='{}']//div[contains(@class, '{}')]".format(location_list_id, data_class_name)) if "display: none" not in element.get_attribute("style")]
-        results = []
-
-        for i, element in enumerate(elements):
-            try:
-                # Extracting details
-                name = element.find_element(By.TAG_NAME, "h4").text
-                address = element.find_element(By.CLASS_NAME, "infoboxcontent").find_element(By.TAG_NAME, "p").text
-                
-                # handle empty address
-                if not address:
-                    address = None
-
-                # Extract latitude and longitude
-                latitude = element.get_attribute("data-latitude")
-                longitude = element.get_attribute("data-longitude")
-                
-                # Extract operating hours by checking for weekday names
-                all_paragraphs = element.find_element(By.CLASS_NAME, "infoboxcontent").find_elements(By.TAG_NAME, "p")
-                operating_hours = [p.text for p in all_paragraphs if any(day in p.text for day in weekdays)]
-
-                # Allow empty operating hours if none are found
-                if not operating_hours:
-                    operating_hours = None
-                else:
-                    # Join the operating hours into a single string with newlines
-                    operating_hours = "\n".join(operating_hours)
-
-                # Extract Waze link
-                waze_link = element.find_element(By.CLASS_NAME, "directionButton").find_elements(By.TAG_NAME, "a")[1].get_attribute("href")
-                waze_link = fix_duplicated_link(waze_link)
-
-                result  = Outlet(
-                    id = str(uuid4()),
-                    name=name,
-                    address=address,
-                    operating_hours=operating_hours,
-                    waze_link=waze_link,
-                    latitude=latitude,
-                    longitude=longitude
-                )
-
-                results.append(result)
-
-                # print progress
-                print(f"Progress: {i+1}/{len(elements)}")
-
-            except UnexpectedAlertPresentException:
-                handle_alert(driver)
-
-            except Exception as e:
-                print(f"Skipping element: {e}")
-
-        return results
+        driver = _worker_driver()
+        search_outlets(driver, region)
+        if _worker["record_dir"]:
+            record_page(_worker["record_dir"], region, driver.page_source)
+        records = extractors[_worker["extraction"]](driver)
+        print(f"Scraped {len(records)} outlets for {region!r}")
+        return records
+
+    except Exception as e:
+        print(f"Error scraping {region!r}: {e}")
+        # start the next region on a fresh browser
+        if _worker.get("finalizer"):
+            _worker["finalizer"]()
+        _worker["driver"] = None
+        # an empty result would mark every outlet of the region as removed, fail the whole scrape instead;
+        # Selenium exceptions do not always pickle, so only their message crosses the process boundary
+        raise RegionScrapeFailed(f"Error scraping {region!r}: {e}") from None
+
+def iter_replayed_outlets(directory, regions=None):
+    """Yields outlets from recorded result pages, every page in `directory` when no regions are given"""
+    seen = set()
+    for region, records in iter_recorded_records(directory, regions, data_class_name, location_list_id):
+        print(f"Replayed {len(records)} outlets for {region!r}")
+        for outlet in build_outlets(records):
+            if outlet.id not in seen:
+                seen.add(outlet.id)
+                yield outlet
+
+def iter_scraped_outlets(headless=True, extraction="script", regions=None, workers=None):
+    """
+    Yields outlets as soon as each region finishes, fanning the search terms out over a pool of
+    worker processes that each drive one reusable headless Chrome. Outlets found by several
+    regions share an ID (derived from name and coordinates) and are only yielded once.
+
+    Args:
+        headless (bool): Run Chrome without a window
+        extraction (str): "script" reads every outlet card in one execute_script round trip,
+            "webdriver" reads them element by element
+        regions (list[str]): Search terms, defaults to SCRAPE_REGIONS
+        workers (int): Number of browsers, defaults to SCRAPER_POOL_SIZE
+
+    When SCRAPER_REPLAY_DIR is set, recorded pages are read instead and no browser is started.
+    """
+    if replay_dir:
+        yield from iter_replayed_outlets(replay_dir, regions)
+        return
+
+    regions = regions or search_strings
+    workers = max(1, min(workers or pool_size, len(regions)))
+
+    # resolve the driver binary once, instead of once per browser
+    driver_path = resolve_driver_path()
+    seen = set()
+
+    # spawn rather than fork, ingest runs inside the multi-threaded API process
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(driver_path, headless, extraction, record_dir)
+    ) as executor:
+        futures = [executor.submit(_scrape_region, region) for region in regions]
+        try:
+            for future in as_completed(futures):
+                for outlet in build_outlets(future.result()):
+                    if outlet.id not in seen:
+                        seen.add(outlet.id)
+                        yield outlet
+        except BaseException:
+            # the run is failing, do not wait for the regions that have not started
+            for future in futures:
+                future.cancel()
+            raise
+
+def scrape_data(headless=True, extraction="script", regions=None, workers=None):
+    """Scrapes every region and returns the deduplicated outlets, see iter_scraped_outlets"""
+    try:
+        # Extract data
+        return list(iter_scraped_outlets(headless, extraction, regions, workers))
 
     except Exception as e:
         print(f"Error: {e}")
         return []
 
-    finally:
-        driver.quit()  # Close the browser
 
+def outlet_id(name, latitude, longitude):
+    """
+    Derives a stable outlet ID from the attributes that identify an outlet, so the same outlet
+    keeps its ID across scrapes. Coordinates are rounded to 6 decimals (~10 cm).
+    """
+    coordinates = [f"{float(value):.6f}" if value not in (None, "") else "" for value in (latitude, longitude)]
+    key = "|".join([name.strip(), *coordinates])
+    return str(uuid5(outlet_id_namespace, key))
 
 def handle_alert(driver):
     """Handles unexpected alerts by dismissing them."""
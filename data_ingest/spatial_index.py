@@ -0,0 +1,185 @@
+import math
+import os
+import numpy as np
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+from data_ingest.distance_compute import DISTANCE_METHOD, outlet_coordinates, pairwise_distances
+from models.models import Outlet
+
+# Radius of an outlet's catchment area; two outlets overlap when they are closer than this
+CATCHMENT_RADIUS_KM = float(os.getenv("CATCHMENT_RADIUS_KM", "5.0"))
+
+# Shortest length of one degree of latitude / longitude (at the equator) on WGS-84, in kilometers.
+# Using the lower bound keeps every cell at least radius_km wide, so neighbours are always in adjacent cells.
+KM_PER_DEG_LAT = 110.574
+KM_PER_DEG_LON_EQUATOR = 111.320
+
+
+def overlap_row(outlet1_id: str, outlet2_id: str, distance: float) -> dict:
+    """An overlappingoutlet row for bulk insert, much cheaper to build than an OverlappingOutlet"""
+    return {"outlet1_id": outlet1_id, "outlet2_id": outlet2_id, "distance": distance}
+
+
+class GridIndex:
+    """
+    Buckets points into latitude/longitude cells that are at least `radius_km` wide, so every point
+    within `radius_km` of a location lies in the 3x3 block of cells around it.
+
+    Longitude cells widen towards the poles, so each row of cells has its own width. The antimeridian
+    is not wrapped, which is fine for outlets within one country.
+    """
+
+    def __init__(self, radius_km: float = CATCHMENT_RADIUS_KM, method: str = DISTANCE_METHOD):
+        self.radius_km = radius_km
+        self.method = method
+        self.cell_lat = radius_km / KM_PER_DEG_LAT
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        self.keys: List[Hashable] = []
+        self.lat: List[float] = []
+        self.lon: List[float] = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_points(cls, keys: List[Hashable], lat, lon, radius_km: float = CATCHMENT_RADIUS_KM,
+                    method: str = DISTANCE_METHOD) -> "GridIndex":
+        """Build an index over many points at once"""
+        index = cls(radius_km, method)
+        index.keys = list(keys)
+        index.lat = [float(x) for x in lat]
+        index.lon = [float(x) for x in lon]
+        for position, (point_lat, point_lon) in enumerate(zip(index.lat, index.lon)):
+            index.cells.setdefault(index._cell(point_lat, point_lon), []).append(position)
+        return index
+
+    def _cell_lon(self, row: int) -> float:
+        # width of a cell in this row, measured at the edge closest to the pole
+        edge = min(89.9, max(abs(row), abs(row + 1)) * self.cell_lat)
+        return self.radius_km / (KM_PER_DEG_LON_EQUATOR * math.cos(math.radians(edge)))
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        row = math.floor(lat / self.cell_lat)
+        return row, math.floor(lon / self._cell_lon(row))
+
+    def _neighbour_cells(self, row: int, lon_low: float, lon_high: float) -> List[Tuple[int, int]]:
+        """Cells in the rows around `row` that may hold points within radius_km of the longitude span"""
+        cells = []
+        for r in (row - 1, row, row + 1):
+            width = self._cell_lon(r)
+            # the radius spans at most the wider of the two rows' cell widths in longitude,
+            # padded because a great circle bows towards the pole and is shorter than the parallel
+            reach = 1.05 * max(width, self._cell_lon(row))
+            for c in range(math.floor((lon_low - reach) / width), math.floor((lon_high + reach) / width) + 1):
+                if (r, c) in self.cells:
+                    cells.append((r, c))
+        return cells
+
+    def _candidates(self, lat: float, lon: float) -> List[int]:
+        row = math.floor(lat / self.cell_lat)
+        candidates = []
+        for cell in self._neighbour_cells(row, lon, lon):
+            candidates.extend(self.cells[cell])
+        return candidates
+
+    def neighbours(self, lat: float, lon: float) -> List[Tuple[int, float]]:
+        """(position, distance) of every indexed point strictly within radius_km of the location"""
+        candidates = self._candidates(lat, lon)
+        if not candidates:
+            return []
+        # index the lists directly, converting them to arrays would cost O(n) per lookup
+        distances = pairwise_distances(
+            [lat], [lon], [self.lat[k] for k in candidates], [self.lon[k] for k in candidates], self.method
+        )[0]
+        return [(candidates[k], float(distances[k])) for k in np.nonzero(distances < self.radius_km)[0]]
+
+    def add(self, key: Hashable, lat: float, lon: float) -> List[Tuple[Hashable, float]]:
+        """Insert a point and return (key, distance) for the already indexed points within radius_km of it"""
+        lat, lon = float(lat), float(lon)
+        found = [(self.keys[position], distance) for position, distance in self.neighbours(lat, lon)]
+
+        self.cells.setdefault(self._cell(lat, lon), []).append(len(self.keys))
+        self.keys.append(key)
+        self.lat.append(lat)
+        self.lon.append(lon)
+        return found
+
+    def pairs_within(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Every pair of indexed points closer than radius_km, as (i, j, distance) arrays of positions with i < j,
+        sorted by (i, j). Only cells adjacent to each other are compared.
+        """
+        lat, lon = np.asarray(self.lat), np.asarray(self.lon)
+        members = {cell: np.asarray(positions) for cell, positions in self.cells.items()}
+        found_i, found_j, found_d = [], [], []
+
+        for (row, col), here in members.items():
+            # each unordered pair of cells is visited once, from its smaller key
+            width = self._cell_lon(row)
+            there = [
+                members[cell] for cell in self._neighbour_cells(row, col * width, (col + 1) * width)
+                if cell > (row, col)
+            ]
+
+            # pairs inside this cell
+            if len(here) > 1:
+                d = pairwise_distances(lat[here], lon[here], lat[here], lon[here], self.method)
+                a, b = np.nonzero(np.triu(d < self.radius_km, k=1))
+                found_i.append(here[a])
+                found_j.append(here[b])
+                found_d.append(d[a, b])
+
+            # pairs between this cell and its neighbours
+            if there:
+                there = np.concatenate(there)
+                d = pairwise_distances(lat[here], lon[here], lat[there], lon[there], self.method)
+                a, b = np.nonzero(d < self.radius_km)
+                found_i.append(here[a])
+                found_j.append(there[b])
+                found_d.append(d[a, b])
+
+        if not found_i:
+            empty = np.empty(0, dtype=int)
+            return empty, empty, np.empty(0)
+
+        i, j, d = np.concatenate(found_i), np.concatenate(found_j), np.concatenate(found_d)
+        i, j = np.minimum(i, j), np.maximum(i, j)
+        order = np.lexsort((j, i))
+        return i[order], j[order], d[order]
+
+    def pairs_touching(self, positions: Iterable[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Like pairs_within, restricted to pairs that involve at least one of the given positions"""
+        pairs = {}
+        for position in positions:
+            for other, distance in self.neighbours(self.lat[position], self.lon[position]):
+                if other != position:
+                    pairs[(min(position, other), max(position, other))] = distance
+
+        ordered = sorted(pairs)
+        i = np.array([pair[0] for pair in ordered], dtype=int)
+        j = np.array([pair[1] for pair in ordered], dtype=int)
+        return i, j, np.array([pairs[pair] for pair in ordered], dtype=float)
+
+
+def compute_overlapping_outlets(
+    outlets: List[Outlet], radius_km: float = CATCHMENT_RADIUS_KM, method: str = DISTANCE_METHOD,
+    affected: Optional[Set[str]] = None
+) -> List[dict]:
+    """
+    Find every pair of outlets with overlapping catchments without computing the full distance matrix,
+    as overlap_row dicts.
+    When `affected` outlet IDs are given, only the pairs involving at least one of them are returned.
+    """
+    lat, lon = outlet_coordinates(outlets)
+    index = GridIndex.from_points([outlet.id for outlet in outlets], lat, lon, radius_km, method)
+
+    if affected is None:
+        rows, cols, distances = index.pairs_within()
+    else:
+        rows, cols, distances = index.pairs_touching(
+            position for position, outlet in enumerate(outlets) if outlet.id in affected
+        )
+    ids = [outlet.id for outlet in outlets]
+    return [
+        overlap_row(ids[i], ids[j], distance)
+        for i, j, distance in zip(rows.tolist(), cols.tolist(), distances.tolist())
+    ]
@@ -0,0 +1,96 @@
+"""
+Progress of the ingest running in this process, reported by /readyz.
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+
+class IngestCancelled(Exception):
+    """The running ingest was cancelled before persisting, e.g. because this process lost the ingest leadership"""
+
+
+class IngestStatus:
+    """One ingest at a time: the running one's stage, and the outcome of the last one"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = False
+        self.trigger: Optional[str] = None
+        self.stage: Optional[str] = None
+        self.started_at: Optional[datetime] = None
+        self._stage_started = 0.0
+        self.last_outcome: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self._error: Optional[str] = None
+        self.last_finished_at: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.runs = 0
+        # set to make the running ingest stop before it persists anything
+        self.cancelled = threading.Event()
+
+    def begin(self, trigger: str) -> bool:
+        """Mark an ingest as started; False if one is already running"""
+        with self._lock:
+            if self.running:
+                return False
+            self.running = True
+            self.trigger = trigger
+            self.stage = "starting"
+            self._error = None
+            self.cancelled.clear()
+            self.started_at = datetime.now()
+            self._stage_started = time.perf_counter()
+            return True
+
+    def set_stage(self, stage: str):
+        if self.running:
+            print(f"Ingest stage: {stage}")
+            self.stage = stage
+            self._stage_started = time.perf_counter()
+
+    def cancel(self, reason: str):
+        """Ask the running ingest, if any, to stop"""
+        with self._lock:
+            if self.running and not self.cancelled.is_set():
+                print(f"Cancelling the running ingest: {reason}")
+                self._error = reason
+                self.cancelled.set()
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise IngestCancelled(self._error or "Ingest cancelled")
+
+    def record_error(self, error: str):
+        """An error the running ingest recovered from, e.g. a failed scrape that kept the existing data"""
+        self._error = error
+
+    def finish(self, outcome: str, error: Optional[str] = None):
+        """Record the outcome: updated, kept (the existing data was kept), cancelled or failed"""
+        with self._lock:
+            self.last_outcome = outcome
+            self.last_error = error or self._error
+            self.last_finished_at = datetime.now()
+            self.last_duration = (self.last_finished_at - self.started_at).total_seconds()
+            self.runs += 1
+            self.running = False
+            self.stage = None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "running": self.running,
+                "trigger": self.trigger if self.running else None,
+                "stage": self.stage,
+                "stage_seconds": round(time.perf_counter() - self._stage_started, 1) if self.running else None,
+                "started_at": self.started_at.isoformat() if self.running else None,
+                "last_outcome": self.last_outcome,
+                "last_error": self.last_error,
+                "last_finished_at": self.last_finished_at.isoformat() if self.last_finished_at else None,
+                "last_duration_seconds": round(self.last_duration, 1) if self.last_duration is not None else None,
+                "runs": self.runs,
+            }
+
+
+ingest_status = IngestStatus()
@@ -1,15 +1,18 @@
 from dotenv import load_dotenv
+from sqlalchemy import event
 from sqlmodel import Session, create_engine, SQLModel
+from metrics import count_query
 import os
 
 load_dotenv()
 DB_URL = os.getenv("DB_CONN")
-print(DB_URL)
 engine = create_engine(DB_URL)
+# counts queries per process and per request for /metrics
+event.listen(engine, "before_cursor_execute", count_query)
 
 def get_db():
     SQLModel.metadata.create_all(engine)
 
 def get_session():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
@@ -0,0 +1,102 @@
+"""
+Static k-d tree over points on the unit sphere, for nearest neighbour lookups without scipy.
+
+Coordinates are converted to 3D unit vectors. The straight-line (chord) distance between two of
+them grows with their great-circle distance, so the k nearest by chord are the k nearest on the
+sphere, and there is no special case at the antimeridian or the poles.
+"""
+from typing import List, Tuple
+import numpy as np
+from data_ingest.distance_compute import EARTH_RADIUS_KM
+
+LEAF_SIZE = 32
+
+
+def unit_vectors(lat, lon) -> np.ndarray:
+    lat, lon = np.radians(np.asarray(lat, dtype=float)), np.radians(np.asarray(lon, dtype=float))
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def chord_to_km(chord: np.ndarray) -> np.ndarray:
+    """Great-circle distance on a spherical earth for chord lengths on the unit sphere"""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+class KDTree:
+    """
+    Balanced tree, split at the median of the widest dimension. Points are reordered so that
+    every node covers a contiguous slice of them; leaves are scanned with numpy.
+    """
+
+    def __init__(self, points: np.ndarray, leaf_size: int = LEAF_SIZE):
+        self.leaf_size = leaf_size
+        order = np.arange(len(points))
+        # per node: [start, end) slice of the reordered points, split dimension and value, children (-1 for leaves)
+        self.start: List[int] = []
+        self.end: List[int] = []
+        self.dim: List[int] = []
+        self.split: List[float] = []
+        self.left: List[int] = []
+        self.right: List[int] = []
+        if len(points):
+            self._build(np.asarray(points, dtype=float), order, 0, len(points))
+        self.order = order
+        self.points = np.asarray(points, dtype=float)[order] if len(points) else np.empty((0, 3))
+
+    def __len__(self):
+        return len(self.order)
+
+    def _build(self, points: np.ndarray, order: np.ndarray, start: int, end: int) -> int:
+        node = len(self.start)
+        self.start.append(start)
+        self.end.append(end)
+        self.dim.append(-1)
+        self.split.append(0.0)
+        self.left.append(-1)
+        self.right.append(-1)
+        if end - start <= self.leaf_size:
+            return node
+
+        members = points[order[start:end]]
+        dim = int(np.argmax(members.max(axis=0) - members.min(axis=0)))
+        middle = (end - start) // 2
+        order[start:end] = order[start:end][np.argpartition(members[:, dim], middle)]
+        self.dim[node] = dim
+        self.split[node] = float(points[order[start + middle], dim])
+        self.left[node] = self._build(points, order, start, start + middle)
+        self.right[node] = self._build(points, order, start + middle, end)
+        return node
+
+    def query(self, point: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(positions in the original point order, chord distances) of the k nearest points, nearest first"""
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty(0, dtype=int), np.empty(0)
+
+        best_distance = np.full(k, np.inf)
+        best_index = np.zeros(k, dtype=int)
+        worst = np.inf
+        # (node, lower bound of the squared distance to any point under it)
+        stack = [(0, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if bound >= worst:
+                continue
+            if self.left[node] < 0:
+                start, end = self.start[node], self.end[node]
+                distance = ((self.points[start:end] - point) ** 2).sum(axis=1)
+                merged_distance = np.concatenate((best_distance, distance))
+                merged_index = np.concatenate((best_index, np.arange(start, end)))
+                keep = np.argpartition(merged_distance, k - 1)[:k]
+                best_distance, best_index = merged_distance[keep], merged_index[keep]
+                worst = best_distance.max()
+                continue
+
+            offset = point[self.dim[node]] - self.split[node]
+            near, far = (self.left[node], self.right[node]) if offset < 0 else (self.right[node], self.left[node])
+            # the far side is only worth visiting when the splitting plane is closer than the kth best
+            stack.append((far, max(bound, offset * offset)))
+            stack.append((near, bound))
+
+        ranked = np.argsort(best_distance)
+        return self.order[best_index[ranked]], np.sqrt(best_distance[ranked])
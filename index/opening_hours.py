@@ -0,0 +1,137 @@
+"""
+Operating hours compiled into minute-of-week intervals, so "which outlets are open at ..." is a
+handful of vectorized comparisons instead of a GREATEST/COALESCE expression over 16 columns.
+
+Minute 0 is Monday 00:00 and the week has 10080 minutes. Each day's (open, close) becomes one
+interval [open, close); a closing time at or before the opening time runs past midnight into the
+next day (equal times mean open around the clock), and intervals running past Sunday midnight
+wrap around to Monday. Every interval remembers the day it opened on, which is what public
+holidays need: on a holiday an outlet's public holiday hours replace the hours it would open
+with that day, while hours carried over from the night before still apply. A holiday's own
+hours are not carried into the day after it.
+"""
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from datetime import datetime, time
+from typing import Dict, Tuple
+import numpy as np
+import pytz
+
+# Day keys of OutletOperatingHours, in datetime.weekday() order
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+PUBLIC_HOLIDAY = "public_holiday"
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+@lru_cache(maxsize=1)
+def timezone():
+    return pytz.timezone(os.getenv("TIMEZONE") or "UTC")
+
+
+def local_now() -> datetime:
+    """Current time in the configured TIMEZONE"""
+    return datetime.now(timezone())
+
+
+def to_local(when: datetime) -> datetime:
+    """`when` in the configured TIMEZONE; naive datetimes are taken to be local already"""
+    if when.tzinfo is None:
+        return timezone().localize(when)
+    return when.astimezone(timezone())
+
+
+def minute_of_week(when: datetime) -> int:
+    return when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+
+
+def day_interval(opening: time, closing: time) -> Tuple[int, int]:
+    """[start, end) in minutes from the opening day's midnight, end may run into the next day"""
+    start = opening.hour * 60 + opening.minute
+    end = closing.hour * 60 + closing.minute
+    if end <= start:
+        end += MINUTES_PER_DAY
+    return start, end
+
+
+@dataclass(frozen=True)
+class WeekSchedule:
+    """Opening intervals of many outlets, identified by their position in the outlet list"""
+    size: int
+    start: np.ndarray  # minute of week, int32, sorted
+    end: np.ndarray
+    owner: np.ndarray  # outlet position of each interval
+    day: np.ndarray  # weekday the interval opened on
+    # public holiday intervals, in minutes from the holiday's midnight
+    holiday_start: np.ndarray
+    holiday_end: np.ndarray
+    holiday_owner: np.ndarray
+    # whether each regular interval's owner has public holiday hours
+    owner_has_holiday: np.ndarray
+
+    @classmethod
+    def compile(cls, size: int, hours: Dict[int, Dict[str, Tuple[time, time]]]) -> "WeekSchedule":
+        """Compile {outlet position: {day key: (open, close)}} for `size` outlets"""
+        start, end, owner, day = [], [], [], []
+        holiday_start, holiday_end, holiday_owner = [], [], []
+        for position, days in hours.items():
+            for weekday, key in enumerate(DAYS):
+                if key not in days:
+                    continue
+                begin, finish = day_interval(*days[key])
+                begin, finish = begin + weekday * MINUTES_PER_DAY, finish + weekday * MINUTES_PER_DAY
+                # split intervals that run past Sunday midnight
+                for piece_start, piece_end in ((begin, min(finish, MINUTES_PER_WEEK)), (0, finish - MINUTES_PER_WEEK)):
+                    if piece_end > piece_start:
+                        start.append(piece_start)
+                        end.append(piece_end)
+                        owner.append(position)
+                        day.append(weekday)
+            if PUBLIC_HOLIDAY in days:
+                begin, finish = day_interval(*days[PUBLIC_HOLIDAY])
+                holiday_start.append(begin)
+                holiday_end.append(finish)
+                holiday_owner.append(position)
+
+        has_holiday = np.zeros(size, dtype=bool)
+        has_holiday[holiday_owner] = True
+        order = np.argsort(np.array(start, dtype=np.int32), kind="stable")
+        owner = np.array(owner, dtype=np.int32)[order]
+        return cls(
+            size=size,
+            start=np.array(start, dtype=np.int32)[order],
+            end=np.array(end, dtype=np.int32)[order],
+            owner=owner,
+            day=np.array(day, dtype=np.int8)[order],
+            holiday_start=np.array(holiday_start, dtype=np.int32),
+            holiday_end=np.array(holiday_end, dtype=np.int32),
+            holiday_owner=np.array(holiday_owner, dtype=np.int32),
+            owner_has_holiday=has_holiday[owner],
+        )
+
+    def open_mask(self, minute: int, public_holiday: bool = False) -> np.ndarray:
+        """Boolean array over outlet positions, True for outlets open at `minute` of the week"""
+        # no interval is longer than a day, so only those starting in the last 24 hours can cover it
+        window = slice(
+            np.searchsorted(self.start, minute - MINUTES_PER_DAY, side="right"),
+            np.searchsorted(self.start, minute, side="right"),
+        )
+        covers = minute < self.end[window]
+        open_ = np.zeros(self.size, dtype=bool)
+        if not public_holiday:
+            open_[self.owner[window][covers]] = True
+            return open_
+
+        weekday, minute_of_day = divmod(minute, MINUTES_PER_DAY)
+        # holiday hours replace the intervals opening today, carried over ones still count
+        covers &= ~(self.owner_has_holiday[window] & (self.day[window] == weekday))
+        open_[self.owner[window][covers]] = True
+        holiday = (self.holiday_start <= minute_of_day) & (minute_of_day < self.holiday_end)
+        open_[self.holiday_owner[holiday]] = True
+        return open_
+
+    def open_at(self, when: datetime, public_holiday: bool = False) -> np.ndarray:
+        """Positions of the outlets open at `when`, converted to the configured TIMEZONE"""
+        return np.flatnonzero(self.open_mask(minute_of_week(to_local(when)), public_holiday))
@@ -0,0 +1,190 @@
+"""
+In-process snapshot of the outlet tables, for the questions the QA agent and the API answer most:
+nearest outlets, outlets on a map viewport, outlets open at a given time, overlaps of an outlet,
+outlets by name and paginated outlet lists.
+
+The snapshot is read from the database once, rebuilt right after every ingest and never modified
+in between, so requests read it without locks or database round trips.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, time
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlmodel import Session, select
+from cache import ResponseCache
+from db import engine
+from index.kdtree import KDTree, chord_to_km, unit_vectors
+from index.opening_hours import DAYS, PUBLIC_HOLIDAY, WeekSchedule
+from index.search import SearchIndex
+from models.models import LatestUpdatedTimestamp, Outlet, OutletOperatingHours, OverlappingOutlet
+
+# Outlet columns held by the snapshot, in the order lists are projected by default
+FIELDS = ("id", "name", "address", "latitude", "longitude", "operating_hours", "waze_link")
+MAP_FIELDS = ("id", "name", "latitude", "longitude")
+
+
+@dataclass(frozen=True)
+class OutletIndex:
+    ids: List[str] = field(default_factory=list)
+    names: List[str] = field(default_factory=list)
+    addresses: List[str] = field(default_factory=list)
+    # every outlet's FIELDS, as served by the list endpoints
+    records: List[dict] = field(default_factory=list)
+    # every outlet's MAP_FIELDS, so map responses do not build a dict per outlet; shared, do not modify
+    map_records: List[dict] = field(default_factory=list)
+    lat: np.ndarray = field(default_factory=lambda: np.empty(0))
+    lon: np.ndarray = field(default_factory=lambda: np.empty(0))
+    position: Dict[str, int] = field(default_factory=dict)
+    # ingest timestamp the snapshot was read at
+    generation: str = ""
+    # outlet ID -> [(other outlet ID, distance)], both directions
+    overlaps: Dict[str, List[Tuple[str, float]]] = field(default_factory=dict)
+    # operating hours compiled into minute-of-week intervals
+    schedule: WeekSchedule = field(default_factory=lambda: WeekSchedule.compile(0, {}))
+    # k-d tree over the outlets with coordinates, tree positions map to outlet positions through `located`
+    tree: KDTree = field(default_factory=lambda: KDTree(np.empty((0, 3))))
+    located: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=int))
+    # positions of the outlets with coordinates, by latitude, for viewport lookups
+    by_lat: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=int))
+    sorted_lat: np.ndarray = field(default_factory=lambda: np.empty(0))
+    # trigram index over names and addresses
+    text: SearchIndex = field(default_factory=lambda: SearchIndex([], []))
+
+    @classmethod
+    def load(cls) -> "OutletIndex":
+        """Read every outlet, overlap and operating hours row and the ingest timestamp (4 queries)"""
+        with Session(engine) as session:
+            # id, name, address, latitude, longitude, ...
+            outlets = session.exec(select(*(getattr(Outlet, name) for name in FIELDS))).all()
+            overlaps = session.exec(
+                select(OverlappingOutlet.outlet1_id, OverlappingOutlet.outlet2_id, OverlappingOutlet.distance)
+            ).all()
+            hours = session.exec(select(OutletOperatingHours)).all()
+            timestamp = session.exec(select(LatestUpdatedTimestamp.timestamp)).first()
+
+            ids = [row[0] for row in outlets]
+            position = {outlet_id: i for i, outlet_id in enumerate(ids)}
+            lat = np.array([row[3] if row[3] is not None else np.nan for row in outlets], dtype=float)
+            lon = np.array([row[4] for row in outlets], dtype=float)
+
+            by_outlet: Dict[str, List[Tuple[str, float]]] = {}
+            for outlet1_id, outlet2_id, distance in overlaps:
+                by_outlet.setdefault(outlet1_id, []).append((outlet2_id, distance))
+                by_outlet.setdefault(outlet2_id, []).append((outlet1_id, distance))
+
+            # {position: {"mon": (open, close), ...}}, days without hours are left out
+            compiled: Dict[int, Dict[str, Tuple[time, time]]] = {}
+            for record in hours:
+                if record.outlet_id not in position:
+                    continue
+                days = compiled.setdefault(position[record.outlet_id], {})
+                for day in DAYS + [PUBLIC_HOLIDAY]:
+                    opening, closing = getattr(record, f"{day}_open"), getattr(record, f"{day}_close")
+                    if opening is not None and closing is not None:
+                        days[day] = (opening, closing)
+
+        names = [row[1] for row in outlets]
+        addresses = [row[2] or "" for row in outlets]
+        located = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        by_lat = located[np.argsort(lat[located], kind="stable")]
+        return cls(
+            ids=ids,
+            names=names,
+            addresses=addresses,
+            records=[dict(zip(FIELDS, row)) for row in outlets],
+            map_records=[{name: row[FIELDS.index(name)] for name in MAP_FIELDS} for row in outlets],
+            lat=lat,
+            lon=lon,
+            position=position,
+            generation=timestamp or "",
+            overlaps=by_outlet,
+            schedule=WeekSchedule.compile(len(ids), compiled),
+            tree=KDTree(unit_vectors(lat[located], lon[located])),
+            located=located,
+            by_lat=by_lat,
+            sorted_lat=lat[by_lat],
+            text=SearchIndex(names, addresses),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def describe(self, i: int, **extra) -> dict:
+        return {"id": self.ids[i], "name": self.names[i], "address": self.addresses[i], **extra}
+
+    def project(self, i: int, fields: Sequence[str] = FIELDS) -> dict:
+        """The requested FIELDS of one outlet"""
+        if fields == MAP_FIELDS:
+            return self.map_records[i]
+        record = self.records[i]
+        return {name: record[name] for name in fields}
+
+    def resolve(self, outlet: str) -> Optional[int]:
+        """Position of an outlet given by ID or name, falling back to the best name match"""
+        if outlet in self.position:
+            return self.position[outlet]
+        matches = self.search(outlet, limit=1)
+        return self.position[matches[0]["id"]] if matches else None
+
+    def nearest_positions(self, latitude: float, longitude: float, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """(positions, great-circle distances in km) of the k outlets closest to a coordinate, closest first"""
+        if not (np.isfinite(latitude) and np.isfinite(longitude)):
+            return np.empty(0, dtype=int), np.empty(0)
+        # ranked on a sphere, the tree's own metric: within ~0.6% of the ellipsoidal distance
+        candidates, chords = self.tree.query(unit_vectors([latitude], [longitude])[0], k)
+        return self.located[candidates], chord_to_km(chords)
+
+    def nearest(self, latitude: float, longitude: float, k: int = 5, exclude: Optional[int] = None) -> List[dict]:
+        """The k outlets closest to a coordinate, closest first, leaving out the outlet at position `exclude`"""
+        positions, distances = self.nearest_positions(latitude, longitude, k if exclude is None else k + 1)
+        # outlets sharing coordinates tie in any order, so filter instead of dropping the first result
+        keep = positions != exclude
+        return [
+            self.describe(int(i), distance_km=round(float(d), 3)) for i, d in zip(positions[keep][:k], distances[keep][:k])
+        ]
+
+    def within(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Positions of the outlets inside a bounding box, by latitude; west > east crosses the antimeridian"""
+        band = self.by_lat[np.searchsorted(self.sorted_lat, south, side="left"):
+                           np.searchsorted(self.sorted_lat, north, side="right")]
+        lon = self.lon[band]
+        inside = (lon >= west) & (lon <= east) if west <= east else (lon >= west) | (lon <= east)
+        return band[inside]
+
+    def viewport(self, south: float, west: float, north: float, east: float, limit: int) -> Tuple[np.ndarray, int]:
+        """Positions of at most `limit` outlets inside a bounding box, and how many are inside"""
+        positions = self.within(south, west, north, east)
+        count = len(positions)
+        if count > limit:
+            # sampled before anything is projected, spread over the whole box rather than its southern edge
+            positions = positions[np.linspace(0, count - 1, limit).astype(int)]
+        return positions, count
+
+    def overlapping(self, outlet_id: str) -> List[dict]:
+        """Outlets whose catchment overlaps with the given outlet's, closest first"""
+        return [
+            self.describe(self.position[other_id], distance_km=round(distance, 3))
+            for other_id, distance in sorted(self.overlaps.get(outlet_id, []), key=lambda pair: pair[1])
+            if other_id in self.position
+        ]
+
+    def open_at(self, when: datetime, public_holiday: bool = False) -> List[dict]:
+        """Outlets open at `when`, a naive local time or an aware datetime in any timezone"""
+        return [self.describe(int(i)) for i in self.schedule.open_at(when, public_holiday)]
+
+    def search_matches(self, query: str, limit: int = 10, latitude: Optional[float] = None,
+                       longitude: Optional[float] = None) -> List[Tuple[int, float, Optional[float]]]:
+        """(position, score, distance in km) of the best fuzzy matches on name and address, best first"""
+        return self.text.search(query, limit, latitude, longitude, self.lat, self.lon)
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        """Outlets best matching the query by name or address, tolerating typos"""
+        return [self.describe(i, score=round(score, 3)) for i, score, _ in self.search_matches(query, limit)]
+
+
+# rebuilt, and operating hours recompiled, right after every ingest
+_outlet_index = ResponseCache(OutletIndex.load, warm=True)
+
+
+def get_outlet_index() -> OutletIndex:
+    return _outlet_index.get()
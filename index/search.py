@@ -0,0 +1,147 @@
+"""
+Fuzzy outlet search over names and addresses.
+
+Text is normalized (NFKC, case folded, punctuation to spaces) and split into padded character
+trigrams, so a typo only costs the two or three trigrams around it. Each trigram has a posting
+list of the outlets that contain it and an IDF weight; a query only reads the posting lists of its
+own trigrams and scores outlets by the IDF weight they share with it. Trigrams found in many
+outlets (e.g. those of "subway") carry almost no information and are left out of the score,
+which also keeps their long posting lists out of most queries.
+
+Query words that prefix a word of an outlet's name get a bonus, for search-as-you-type, and an
+optional location boosts nearby outlets.
+"""
+import math
+import os
+import re
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+from data_ingest.distance_compute import pairwise_distances
+
+# Trigrams in more than this fraction of outlets are ignored
+MAX_DOCUMENT_FRACTION = 0.3
+# Address matches count for this much of a name match
+ADDRESS_WEIGHT = 0.5
+PREFIX_BONUS = 0.25
+# Outlets scoring below this before the proximity boost are not returned
+MIN_SCORE = float(os.getenv("SEARCH_MIN_SCORE", "0.3"))
+# Score multiplier of an outlet at the caller's location, halved at PROXIMITY_SCALE_KM
+PROXIMITY_BOOST = 0.5
+PROXIMITY_SCALE_KM = float(os.getenv("SEARCH_PROXIMITY_SCALE_KM", "5"))
+
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    return _SEPARATORS.sub(" ", unicodedata.normalize("NFKC", text or "").casefold()).strip()
+
+
+def words(text: str) -> List[str]:
+    return normalize(text).split()
+
+
+def trigrams(text: str) -> Set[str]:
+    grams = set()
+    for word in words(text):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramField:
+    """Posting lists and IDF weights of one text field over every outlet"""
+
+    def __init__(self, texts: List[str]):
+        self.size = len(texts)
+        documents: Dict[str, List[int]] = {}
+        grams_by_outlet = [trigrams(text) for text in texts]
+        for position, grams in enumerate(grams_by_outlet):
+            for gram in grams:
+                documents.setdefault(gram, []).append(position)
+
+        limit = max(1, MAX_DOCUMENT_FRACTION * self.size)
+        # trigrams the index has never seen (typos, mostly) can never be shared, count them lightly
+        self.unknown_weight = 1.0
+        self.postings = {gram: np.array(positions, dtype=np.int32) for gram, positions in documents.items()}
+        self.weights = {gram: math.log(1 + self.size / len(positions)) for gram, positions in documents.items()}
+        self.frequent = {gram for gram, positions in documents.items() if len(positions) > limit}
+        # total weight of each outlet's trigrams, without and with the frequent ones
+        self.norms = np.array([
+            sum(self.weights[gram] for gram in grams if gram not in self.frequent) for grams in grams_by_outlet
+        ])
+        self.norms_with_frequent = np.array([sum(self.weights[gram] for gram in grams) for grams in grams_by_outlet])
+
+    def scores(self, grams: Set[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (coverage, Dice similarity) of every outlet with the query: the share of the query's trigram
+        weight found in the outlet, and the shared weight over both sides' total weight
+        """
+        informative = grams - self.frequent
+        # a query made of frequent trigrams only (e.g. "subway") has to use them
+        norms = self.norms if informative else self.norms_with_frequent
+        grams = informative or grams
+        query_norm = sum(self.weights.get(gram, self.unknown_weight) for gram in grams)
+        known = [gram for gram in grams if gram in self.postings]
+        if known:
+            postings = [self.postings[gram] for gram in known]
+            weights = np.repeat([self.weights[gram] for gram in known], [len(p) for p in postings])
+            shared = np.bincount(np.concatenate(postings), weights=weights, minlength=self.size)
+        else:
+            shared = np.zeros(self.size)
+        if not query_norm:
+            return shared, shared
+        return shared / query_norm, 2 * shared / (query_norm + norms)
+
+
+class SearchIndex:
+    def __init__(self, names: List[str], addresses: List[str]):
+        self.size = len(names)
+        self.name = TrigramField(names)
+        self.address = TrigramField(addresses)
+        # (word, position) of every name word, sorted, for prefix lookups
+        pairs = sorted((word, position) for position, name in enumerate(names) for word in set(words(name)))
+        self.name_words = [word for word, _ in pairs]
+        self.name_word_positions = np.array([position for _, position in pairs], dtype=np.int32)
+
+    def prefixed(self, word: str) -> np.ndarray:
+        """Positions of the outlets with a name word starting with `word`, possibly repeated"""
+        start = bisect_left(self.name_words, word)
+        end = bisect_left(self.name_words, word + "\U0010ffff")
+        return self.name_word_positions[start:end]
+
+    def search(self, query: str, limit: int = 10, lat: Optional[float] = None, lon: Optional[float] = None,
+               outlet_lat: Optional[np.ndarray] = None, outlet_lon: Optional[np.ndarray] = None
+               ) -> List[Tuple[int, float, Optional[float]]]:
+        """(position, score, distance in km or None) of the best matches, best first"""
+        if not self.size:
+            return []
+        grams = trigrams(query)
+        # names are short, so both how much of the query they cover and how closely they match count;
+        # addresses are long and only their coverage of the query does
+        name_coverage, name_similarity = self.name.scores(grams)
+        address_coverage, _ = self.address.scores(grams)
+        scores = (name_coverage + name_similarity) / 2 + ADDRESS_WEIGHT * address_coverage
+        query_words = [word for word in words(query) if len(word) >= 2]
+        for word in query_words:
+            # a repeated position is only added to once
+            scores[self.prefixed(word)] += PREFIX_BONUS / len(query_words)
+
+        positions = np.flatnonzero(scores >= MIN_SCORE)
+        scores = scores[positions]
+        distances = None
+        if lat is not None and lon is not None and outlet_lat is not None and len(positions):
+            distances = pairwise_distances([lat], [lon], outlet_lat[positions], outlet_lon[positions], "haversine")[0]
+            scores = scores * (1 + PROXIMITY_BOOST / (1 + np.nan_to_num(distances, nan=np.inf) / PROXIMITY_SCALE_KM))
+
+        if len(positions) > limit:
+            best = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            best = np.arange(len(positions))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [
+            (int(positions[i]), float(scores[i]),
+             float(distances[i]) if distances is not None and np.isfinite(distances[i]) else None)
+            for i in best
+        ]
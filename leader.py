@@ -0,0 +1,244 @@
+"""
+Coordination between the processes sharing one database: API workers and ingest workers.
+
+Exactly one process, the leader, schedules ingest. Leadership is a lock held for as long as the
+worker lives: a MySQL named lock (GET_LOCK) or a PostgreSQL advisory lock on a connection kept
+open for it, or an exclusive file lock for SQLite, whose workers share a host. The server drops
+the lock when the leader's connection or process dies, and the next follower to try takes over.
+
+Every API worker, leader included, polls the ingest timestamp and refreshes its in-process caches
+when another process has committed a newer generation.
+"""
+import os
+import tempfile
+import zlib
+from datetime import datetime, timedelta
+from typing import Optional
+from apscheduler.schedulers.base import BaseScheduler
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import Session, select
+from cache import caches_generation, invalidate_caches
+from data_ingest.status import ingest_status
+from models.models import LatestUpdatedTimestamp
+
+INGEST_INTERVAL = timedelta(hours=24)
+
+# Name of the lock whose holder schedules ingest, unique per database
+INGEST_LOCK_NAME = os.getenv("INGEST_LOCK_NAME", "subway_outlet_ingest")
+# How often followers try to take over and every worker checks for a new generation
+COORDINATION_INTERVAL_SECONDS = float(os.getenv("COORDINATION_INTERVAL_SECONDS", "30"))
+
+
+def lock_file_path(engine: Engine) -> str:
+    """INGEST_LOCK_FILE, else next to the SQLite database, else in the temporary directory"""
+    if os.getenv("INGEST_LOCK_FILE"):
+        return os.getenv("INGEST_LOCK_FILE")
+    database = engine.url.database
+    if engine.dialect.name == "sqlite" and database and database != ":memory:":
+        return f"{os.path.abspath(database)}.{INGEST_LOCK_NAME}.lock"
+    return os.path.join(tempfile.gettempdir(), f"{INGEST_LOCK_NAME}.lock")
+
+
+class LeaderLock:
+    """Non-blocking, process lifetime lock; `held` is only true while the lock is verified to be ours"""
+
+    def __init__(self, engine: Engine, name: str = INGEST_LOCK_NAME):
+        self.engine = engine
+        self.name = name
+        self.held = False
+        self._connection: Optional[Connection] = None
+        self._file = None
+
+    def acquire(self) -> bool:
+        if self.held:
+            return True
+        try:
+            dialect = self.engine.dialect.name
+            if dialect == "mysql":
+                self.held = self._acquire_on_connection("SELECT GET_LOCK(:name, 0)")
+            elif dialect == "postgresql":
+                self.held = self._acquire_on_connection("SELECT pg_try_advisory_lock(:key)")
+            else:
+                self.held = self._acquire_file()
+        except Exception as e:
+            print(f"Leader lock unavailable: {e}")
+            self.release()
+        return self.held
+
+    def _acquire_on_connection(self, statement: str) -> bool:
+        # the lock belongs to the database session, keep one connection for as long as it is held
+        self._connection = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        acquired = self._connection.execute(
+            text(statement), {"name": self.name, "key": zlib.crc32(self.name.encode())}
+        ).scalar()
+        if not acquired:
+            self._connection.close()
+            self._connection = None
+        return bool(acquired)
+
+    def _acquire_file(self) -> bool:
+        try:
+            import fcntl
+        except ImportError:
+            # no file locks on this platform, assume a single worker
+            return True
+        self._file = open(lock_file_path(self.engine), "a")
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def verify(self) -> bool:
+        """Check that the lock is still ours, e.g. that the server did not drop its connection"""
+        if not self.held or self._connection is None:
+            return self.held
+        try:
+            if self.engine.dialect.name == "mysql":
+                ours = self._connection.execute(
+                    text("SELECT IS_USED_LOCK(:name) = CONNECTION_ID()"), {"name": self.name}
+                ).scalar()
+            else:
+                ours = self._connection.execute(text("SELECT 1")).scalar()
+        except Exception as e:
+            print(f"Leader lock connection lost: {e}")
+            ours = False
+        if not ours:
+            self.release()
+        return self.held
+
+    def release(self):
+        self.held = False
+        if self._connection is not None:
+            try:
+                # closing the connection returns it to the pool, where the lock would stay held
+                self._connection.invalidate()
+            except Exception:
+                pass
+            self._connection = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def latest_generation(engine: Engine) -> Optional[str]:
+    with Session(engine) as session:
+        return session.exec(select(LatestUpdatedTimestamp.timestamp)).first()
+
+
+def refresh_if_new_generation(engine: Engine) -> bool:
+    """Rebuild the in-process caches if another worker committed an ingest since they were built"""
+    generation = latest_generation(engine)
+    if generation is None or generation == caches_generation():
+        return False
+    print(f"New data generation {generation}, refreshing caches")
+    invalidate_caches(generation)
+    return True
+
+
+def latest_update(session: Session) -> Optional[datetime]:
+    """When ingest last committed, None before the first one"""
+    record = session.exec(select(LatestUpdatedTimestamp).order_by(LatestUpdatedTimestamp.timestamp.desc())).first()
+    return datetime.fromisoformat(record.timestamp) if record else None
+
+
+def should_ingest(session: Session) -> bool:
+    """Check if ingest_data should be triggered based on timestamp."""
+    updated_at = latest_update(session)
+    # ingest stores naive local timestamps, so compare with local time
+    return updated_at is None or datetime.now() - updated_at > INGEST_INTERVAL
+
+
+def run_ingest(trigger: str = "scheduled") -> bool:
+    # the scraper, LLM and distance code is only loaded by the process that ingests
+    from data_ingest.ingester import run_ingest
+    return run_ingest(trigger)
+
+
+class Coordinator:
+    """
+    Periodic job run on a process's scheduler. With `lead`, the process competes for the leader
+    lock and schedules ingest while it holds it; with `refresh`, it rebuilds its caches when a new
+    generation is committed.
+    """
+
+    def __init__(self, scheduler: BaseScheduler, engine: Engine, lead: bool = True, refresh: bool = True):
+        self.scheduler = scheduler
+        self.engine = engine
+        self.lead = lead
+        self.refresh = refresh
+        self.lock = LeaderLock(engine)
+        self._coordinated = False
+
+    @property
+    def role(self) -> str:
+        return "ingest leader" if self.lock.held else "follower" if self.lead else "API only"
+
+    def start(self):
+        """Coordinate once right away, then every COORDINATION_INTERVAL_SECONDS"""
+        self.coordinate()
+        self.scheduler.add_job(
+            self.coordinate,
+            IntervalTrigger(seconds=COORDINATION_INTERVAL_SECONDS),
+            id="coordinate",
+            replace_existing=True
+        )
+
+    def stop(self):
+        self.lock.release()
+
+    def ingest(self, trigger: str = "scheduled") -> bool:
+        """Ingest, unless the lock was lost since the job was scheduled"""
+        if not self.lock.verify():
+            print(f"No longer the ingest leader, skipping the {trigger} ingest")
+            return False
+        return run_ingest(trigger)
+
+    def schedule_ingest(self, takeover: bool = False):
+        """
+        Leader only: ingest every 24 hours, and soon when the data is stale. After taking over from
+        another leader, the catch-up waits one coordination interval: a leader that lost its lock
+        finds out within one and cancels the ingest it may still be running.
+        """
+        self.scheduler.add_job(
+            self.ingest,
+            IntervalTrigger(hours=24),  # Run every 24 hours
+            id="scrape_subway_outlet_data",
+            replace_existing=True
+        )
+        with Session(self.engine) as session:
+            if should_ingest(session):
+                # Catch up in the background, the persisted data (if any) is served in the meantime
+                delay = timedelta(seconds=COORDINATION_INTERVAL_SECONDS + 5)
+                trigger = DateTrigger(run_date=datetime.now() + delay) if takeover else None
+                self.scheduler.add_job(
+                    self.ingest, trigger, kwargs={"trigger": "startup"}, id="startup_ingest", replace_existing=True
+                )
+
+    def unschedule_ingest(self):
+        for job_id in ("scrape_subway_outlet_data", "startup_ingest"):
+            if self.scheduler.get_job(job_id):
+                self.scheduler.remove_job(job_id)
+
+    def coordinate(self):
+        """Take over ingest when no other process holds the lock, and pick up generations committed by the leader"""
+        if self.lock.held and not self.lock.verify():
+            # the new leader scrapes too, stop an ingest still running here before it persists
+            print("Lost the ingest leadership")
+            self.unschedule_ingest()
+            ingest_status.cancel("Lost the ingest leadership")
+        if self.lead and not self.lock.held and self.lock.acquire():
+            print("Became the ingest leader")
+            self.schedule_ingest(takeover=self._coordinated)
+        self._coordinated = True
+        # the leader's own ingest rebuilds its caches when it commits
+        if self.refresh and not ingest_status.running:
+            try:
+                refresh_if_new_generation(self.engine)
+            except Exception as e:
+                print(f"Checking for a new data generation failed: {e}")
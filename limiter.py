@@ -0,0 +1,73 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class QueueFull(Exception):
+    """Every slot is busy and the wait queue is at its limit"""
+
+    def __init__(self, limiter: "ConcurrencyLimiter"):
+        super().__init__(f"{limiter.name} is at capacity: {limiter.active} running, {limiter.waiting} queued")
+        self.limiter = limiter
+
+
+class Slot:
+    """A held slot; releasing it more than once is a no-op"""
+
+    def __init__(self, limiter: "ConcurrencyLimiter"):
+        self._limiter = limiter
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release()
+
+
+class ConcurrencyLimiter:
+    """
+    Bounds how many requests of one kind run at once on the event loop. Up to `max_queue` more
+    wait for a slot in arrival order; beyond that requests are turned away right away, so a burst
+    of slow requests cannot pile up and starve the rest of the API.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def acquire(self) -> Slot:
+        if self.active >= self.max_concurrency and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(self)
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return Slot(self)
+
+    def _release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        slot = await self.acquire()
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def status(self) -> dict:
+        return {
+            "running": self.active,
+            "queued": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
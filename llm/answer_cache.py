@@ -0,0 +1,98 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+# Most answers kept at once, least recently used are evicted first
+QA_CACHE_MAX_ENTRIES = int(os.getenv("QA_CACHE_MAX_ENTRIES", "1024"))
+# Upper bound on the age of any cached answer, in seconds
+QA_CACHE_TTL_SECONDS = float(os.getenv("QA_CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+# Answers that depend on the current time are only served within the same bucket of this many
+# seconds; 0 disables caching them
+QA_CACHE_TIME_BUCKET_SECONDS = float(os.getenv("QA_CACHE_TIME_BUCKET_SECONDS", "60"))
+
+# Questions about the present are time dependent even when the agent does not ask for the time
+TIME_WORDS = re.compile(
+    r"\b(now|today|tonight|tomorrow|yesterday|currently|at the moment|this (morning|afternoon|evening))\b"
+)
+
+
+def normalize_query(query: str) -> str:
+    """Case, width, whitespace and trailing punctuation do not change the question"""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!. ").strip()
+
+
+def mentions_time(query: str) -> bool:
+    return TIME_WORDS.search(normalize_query(query)) is not None
+
+
+class AnswerCache:
+    """
+    LRU cache of agent answers keyed by normalized question and data generation (the ingest
+    timestamp), so an answer is never served once ingest has committed newer data. Answers
+    expire after `ttl` seconds, time dependent ones at the end of their time bucket.
+    """
+
+    def __init__(self, max_entries: int = QA_CACHE_MAX_ENTRIES, ttl: float = QA_CACHE_TTL_SECONDS,
+                 time_bucket: float = QA_CACHE_TIME_BUCKET_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.time_bucket = time_bucket
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def get(self, query: str, generation: Hashable) -> Optional[str]:
+        key = (normalize_query(query), generation)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, query: str, generation: Hashable, answer: str, time_dependent: bool = False):
+        now = time.time()
+        expires_at = now + self.ttl
+        if time_dependent:
+            if self.time_bucket <= 0:
+                return
+            expires_at = min(expires_at, (now // self.time_bucket + 1) * self.time_bucket)
+
+        key = (normalize_query(query), generation)
+        with self._lock:
+            self._entries[key] = (answer, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
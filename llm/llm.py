@@ -1,62 +1,133 @@
-import os
+import asyncio
+import datetime
+import json
+import math
+import threading
+from typing import AsyncIterator, Dict, List, Optional
 from langchain_community.utilities import SQLDatabase
 from langchain_core.tools import tool
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import InfoSQLDatabaseTool, QuerySQLCheckerTool, QuerySQLDatabaseTool
 from langgraph.prebuilt import create_react_agent
-import pandas as pd
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
+from sqlmodel import Session, select
+from cache import on_invalidate
+from data_ingest.distance_store import get_distance_store
+from db import engine
+from index.opening_hours import DAYS, local_now
+from index.outlet_index import get_outlet_index
+from llm.answer_cache import AnswerCache, mentions_time
+from llm.usage import llm_call
+from metrics import Collected
+from models.models import LatestUpdatedTimestamp
+
+# Answers to repeated questions, valid until the next ingest
+answer_cache = AnswerCache()
+# free the previous generation's answers, they can no longer be served anyway
+on_invalidate(answer_cache.clear)
+Collected(
+    "qa_answer_cache_requests_total", "QA answer cache lookups by result", "counter",
+    lambda: {("hit",): answer_cache.hits, ("miss",): answer_cache.misses}, ("result",)
+)
 
 
 @tool
 def get_distance_between_two_outlets(id1: str, id2: str) -> str:
     """Use to get distance between 2 outlets in kilometers""" 
-    df = pd.read_csv(os.getenv("DISTANCE_MATRIX_FILE_PATH"), index_col=0)
-    print(df)
-    return df.at[id1, id2]
+    store = get_distance_store()
+    unknown = [outlet_id for outlet_id in (id1, id2) if outlet_id not in store.index]
+    if unknown:
+        return f"No outlet with ID {', '.join(repr(outlet_id) for outlet_id in unknown)}, look the IDs up first"
+    distance = store.distance(id1, id2)
+    if not math.isfinite(distance):
+        return "Unknown, at least one of the outlets has no coordinates"
+    return str(distance)
 
 @tool
 def get_current_time() -> str:
     """Use to get current time"""
-    # set timezone
-    import pytz
-    timezone = pytz.timezone(os.getenv("TIMEZONE"))
-
-    # get current time
-    import datetime
-    now = datetime.datetime.now(timezone)
-    return now.strftime("%Y-%m-%d %H:%M:%S")
-    
+    return local_now().strftime("%Y-%m-%d %H:%M:%S")
 
-class QAAgent():
-    _instance = None  # Class-level variable to hold the singleton instance
-    
-    def __new__(cls) -> "QAAgent":
-        if cls._instance is None:  # Only create a new instance if it doesn't exist
-            cls._instance = super(QAAgent, cls).__new__(cls)
-            cls._instance._initialize()
-        return cls._instance
+@tool
+def find_nearest_outlets(latitude: Optional[float] = None, longitude: Optional[float] = None,
+                         outlet: Optional[str] = None, k: int = 5) -> str:
+    """
+    Use to find the k outlets nearest to a coordinate, or nearest to an outlet given by name or ID.
+    Returns JSON with id, name, address and distance_km, closest first.
+    """
+    index = get_outlet_index()
+    if outlet is not None:
+        position = index.resolve(outlet)
+        if position is None:
+            return f"No outlet matches {outlet!r}"
+        latitude, longitude = float(index.lat[position]), float(index.lon[position])
+        if not (math.isfinite(latitude) and math.isfinite(longitude)):
+            return f"Outlet {index.names[position]!r} has no coordinates, nearest outlets cannot be found"
+        return json.dumps(index.nearest(latitude, longitude, k, exclude=position))
+    if latitude is None or longitude is None:
+        return "Give either latitude and longitude, or an outlet"
+    return json.dumps(index.nearest(latitude, longitude, k))
+
+@tool
+def find_outlets_open_at(day: Optional[str] = None, time: Optional[str] = None, public_holiday: bool = False) -> str:
+    """
+    Use to find the outlets open on a day of the week (e.g. "sunday") at a time ("23:00"), or open right now
+    when both are left out. Set public_holiday for public holidays. Returns JSON with id, name and address.
+    """
+    when = local_now().replace(tzinfo=None)
+    if time is not None:
+        hour, minute = (int(part) for part in time.strip().split(":")[:2])
+        when = when.replace(hour=hour, minute=minute)
+    if day is not None:
+        weekday = DAYS.index(day.strip().lower()[:3])
+        when += datetime.timedelta(days=(weekday - when.weekday()) % 7)
+    outlets = get_outlet_index().open_at(when, public_holiday)
+    return json.dumps({"when": when.strftime("%A %H:%M"), "count": len(outlets), "outlets": outlets})
+
+@tool
+def find_overlapping_outlets(outlet: str) -> str:
+    """
+    Use to find the outlets within the catchment radius of an outlet given by name or ID.
+    Returns JSON with id, name, address and distance_km, closest first.
+    """
+    index = get_outlet_index()
+    position = index.resolve(outlet)
+    if position is None:
+        return f"No outlet matches {outlet!r}"
+    overlapping = index.overlapping(index.ids[position])
+    return json.dumps({"outlet": index.describe(position), "count": len(overlapping), "overlapping": overlapping})
+
+@tool
+def search_outlets_by_name(query: str) -> str:
+    """Use to look up outlets by (part of) their name or address, typos are tolerated. Returns JSON with id, name, address and score, best match first."""
+    return json.dumps(get_outlet_index().search(query))
+
+# Outlet tools answered from the in-process index, without SQL
+INDEX_TOOLS = [find_nearest_outlets, find_outlets_open_at, find_overlapping_outlets, search_outlets_by_name]
+# Tools whose answer depends on the current time
+TIME_TOOLS = {get_current_time.name, find_outlets_open_at.name}
+
+def current_generation() -> str:
+    """Timestamp of the last ingest, cached answers are only served for the data they were computed from"""
+    with Session(engine) as session:
+        latest = session.exec(select(LatestUpdatedTimestamp.timestamp)).first()
+    return latest or ""
+
+def tools_called(messages) -> List[str]:
+    """Names of the tools the agent called in a finished run"""
+    return [call["name"] for message in messages for call in getattr(message, "tool_calls", None) or []]
     
-    def _initialize(self):
-        self.prepare_qa_agent()
-        
-    def prepare_qa_agent(self):
-        # prepare db connection
-        db = SQLDatabase.from_uri(os.getenv("DB_CONN"))
-        # get LLM instance
-        qa_agent_llm = ChatOpenAI(temperature=0, model_name="gpt-4o")
-        # instantiate SQL database toolkit
-        toolkit = SQLDatabaseToolkit(db=db, llm=qa_agent_llm)
-        # combine the SQL database tools with the self-defined tools
-        tools = toolkit.get_tools() + [get_distance_between_two_outlets]
-
-        # prompt
-        qa_agent_prompt_prefix = """
+
+# Tables the agent may query
+QA_TABLES = ["outlet", "outletoperatinghours", "overlappingoutlet", "latestupdatedtimestamp"]
+
+QA_AGENT_PROMPT = """
         You are an experienced and helpful assistant that answers user questions about Subway Outlets.  
         You have access to interact with a SQL database that contains records of Subway outlets, their operating hours, and overlapping locations.  
 
         ### **Database Schema and Guidelines:**
-        1. **`outlets` Table**  
+        1. **`outlet` Table**  
         - Stores information about each outlet, including its name, location (latitude/longitude), and Waze link.  
 
         2. **`outletoperatinghours` Table**  
@@ -65,16 +136,20 @@ class QAAgent():
         - If all operating hours are `NULL`, exclude that outlet from results.  
         - When computing the latest closing time, ensure `NULL` values do **not** affect the `GREATEST` function.  
 
-        3. **`overlappingoutlets` Table**  
+        3. **`overlappingoutlet` Table**  
         - Tracks outlets that are within a **5km radius** of each other.  
         - Stores relationships between `outlet1` and `outlet2` along with the distance.  
 
         4. **`latestupdatedtimestamp` Table**  
         - Stores the most recent timestamp for updates to outlet records.  
+{table_definitions}
+        ### **Outlet Tools:**  
+        - Use `find_nearest_outlets`, `find_outlets_open_at`, `find_overlapping_outlets` and `search_outlets_by_name` for nearest outlets, outlets open at a time, overlapping outlets and finding outlets by name. They answer in one call, without SQL.  
+        - Use SQL for every other question.  
 
         ### **Query Construction Guidelines:**  
         - Construct syntactically correct MySQL queries based on user input.  
-        - Always check the table structure before forming queries.  
+        - {schema_guideline}  
         - Never use `SELECT *`; only retrieve relevant columns.  
         - Before executing a query, verify its correctness.  
         - If an error occurs, rewrite and retry the query.  
@@ -99,18 +174,152 @@ class QAAgent():
             This ensures missing values do not interfere with finding the latest closing time.  
 
         ### **Process:**  
-        - First, check the database schema to determine what information is available.  
+        - {schema_step}  
         - Generate a MySQL query that retrieves only the relevant data.  
         - Execute the query and return the results in a structured response.  
         """
 
-        self.qa_agent = create_react_agent(qa_agent_llm, tools, prompt=qa_agent_prompt_prefix)
+def bake_schema() -> Dict[str, str]:
+    """CREATE TABLE statement and sample rows of every table the agent may query"""
+    db = SQLDatabase(engine, include_tables=QA_TABLES, sample_rows_in_table_info=3)
+    return {table: db.get_table_info([table]) for table in QA_TABLES}
+
+def qa_agent_prompt(schema: Optional[Dict[str, str]]) -> str:
+    if schema is None:
+        return QA_AGENT_PROMPT.format(
+            table_definitions="",
+            schema_guideline="Always check the table structure before forming queries.",
+            schema_step="First, check the database schema to determine what information is available.",
+        )
+    definitions = "\n\n".join(schema.values())
+    return QA_AGENT_PROMPT.format(
+        table_definitions=f"\n        ### **Table Definitions and Sample Rows:**\n{definitions}\n",
+        schema_guideline="The table definitions above are current, do not look up the schema again.",
+        schema_step="Use the table definitions above to determine what information is available.",
+    )
+
+def build_qa_agent(llm, prebaked_schema: bool = True):
+    """
+    ReAct agent over the outlet tables. With `prebaked_schema` the table definitions and sample rows
+    are read once here and embedded in the prompt, instead of the agent spending turns (and queries)
+    on sql_db_list_tables and sql_db_schema for every question.
+    """
+    if not prebaked_schema:
+        db = SQLDatabase(engine)
+        tools = SQLDatabaseToolkit(db=db, llm=llm).get_tools()
+        return create_react_agent(llm, tools + [get_distance_between_two_outlets, get_current_time, *INDEX_TOOLS],
+                                  prompt=qa_agent_prompt(None))
+
+    schema = bake_schema()
+    # the schema tool answers from the baked definitions, without querying the database
+    db = SQLDatabase(engine, include_tables=QA_TABLES, custom_table_info=schema)
+    query_tool = QuerySQLDatabaseTool(db=db, description=(
+        "Input to this tool is a detailed and correct SQL query, output is a result from the database. "
+        "If the query is not correct, an error message will be returned. If an error is returned, "
+        "rewrite the query, check the query, and try again."
+    ))
+    schema_tool = InfoSQLDatabaseTool(db=db, description=(
+        "Input to this tool is a comma-separated list of tables, output is the schema and sample rows "
+        "for those tables. These are already in your instructions, only use this if they are missing."
+    ))
+    checker_tool = QuerySQLCheckerTool(db=db, llm=llm, description=(
+        f"Use this tool to double check if your query is correct before executing it with {query_tool.name}."
+    ))
+    tools = [query_tool, schema_tool, checker_tool, get_distance_between_two_outlets, get_current_time, *INDEX_TOOLS]
+    return create_react_agent(llm, tools, prompt=qa_agent_prompt(schema))
+
+class QAAgent():
+    _instance = None  # Class-level variable to hold the singleton instance
+    
+    _lock = threading.Lock()  # requests may build the agent from several threads at once
+
+    def __new__(cls) -> "QAAgent":
+        with cls._lock:
+            if cls._instance is None:  # Only create a new instance if it doesn't exist
+                instance = super(QAAgent, cls).__new__(cls)
+                instance._initialize()
+                cls._instance = instance
+        return cls._instance
+    
+    def _initialize(self):
+        self.prepare_qa_agent()
+        # re-bake the schema and sample rows into the prompt after every ingest
+        on_invalidate(self.prepare_qa_agent)
         
+    def prepare_qa_agent(self):
+        # get LLM instance
+        # stream_usage reports tokens for streamed runs too
+        qa_agent_llm = ChatOpenAI(temperature=0, model_name="gpt-4o", stream_usage=True)
+        self.qa_agent = build_qa_agent(qa_agent_llm)
+        
+    def remember(self, query: str, generation: str, answer: str, tools_used):
+        # answers that depend on the current time are only reused within the same time bucket
+        time_dependent = mentions_time(query) or bool(TIME_TOOLS.intersection(tools_used))
+        answer_cache.put(query, generation, answer, time_dependent=time_dependent)
+
     def invoke(self, query: str) -> str:
+        generation = current_generation()
+        answer = answer_cache.get(query, generation)
+        if answer is not None:
+            return answer
+
         message =  [HumanMessage(content=query)]
         # invoke the leave status qa app
-        response = self.qa_agent.invoke({"messages": message})
+        with llm_call("qa_agent") as config:
+            response = self.qa_agent.invoke({"messages": message}, config=config)
 
-        return response["messages"][-1].content
-    
+        answer = response["messages"][-1].content
+        self.remember(query, generation, answer, tools_called(response["messages"]))
+        return answer
+
+    async def ainvoke(self, query: str) -> str:
+        """Like invoke, without blocking the event loop"""
+        generation = await asyncio.to_thread(current_generation)
+        answer = answer_cache.get(query, generation)
+        if answer is not None:
+            return answer
+
+        with llm_call("qa_agent") as config:
+            response = await self.qa_agent.ainvoke({"messages": [HumanMessage(content=query)]}, config=config)
+
+        answer = response["messages"][-1].content
+        self.remember(query, generation, answer, tools_called(response["messages"]))
+        return answer
+
+    async def astream(self, query: str) -> AsyncIterator[dict]:
+        """
+        Yields {"event", "data"} dicts as the agent runs: "tool_start" and "tool_end" for every tool
+        call, "token" for every piece of model output, then "answer" with the final answer
+        """
+        generation = await asyncio.to_thread(current_generation)
+        answer = answer_cache.get(query, generation)
+        if answer is not None:
+            yield {"event": "answer", "data": {"answer": answer, "cached": True}}
+            return
+
+        tools_used = []
+        tokens = []  # output of the latest model turn, the last turn is the answer
+        with llm_call("qa_agent") as config:
+            events = self.qa_agent.astream_events({"messages": [HumanMessage(content=query)]}, config=config, version="v2")
+            async for event in events:
+                kind = event["event"]
+                if kind.startswith("on_chat_model") and event.get("metadata", {}).get("langgraph_node") != "agent":
+                    # models run inside tools, e.g. the SQL query checker, are not part of the answer
+                    continue
+                if kind == "on_chat_model_start":
+                    tokens = []
+                elif kind == "on_chat_model_stream":
+                    content = event["data"]["chunk"].content
+                    if isinstance(content, str) and content:
+                        tokens.append(content)
+                        yield {"event": "token", "data": {"token": content}}
+                elif kind == "on_tool_start":
+                    tools_used.append(event["name"])
+                    yield {"event": "tool_start", "data": {"tool": event["name"], "input": event["data"].get("input")}}
+                elif kind == "on_tool_end":
+                    output = event["data"].get("output")
+                    yield {"event": "tool_end", "data": {"tool": event["name"], "output": str(getattr(output, "content", output))}}
 
+        answer = "".join(tokens)
+        self.remember(query, generation, answer, tools_used)
+        yield {"event": "answer", "data": {"answer": answer, "cached": False}}
@@ -1,6 +1,35 @@
 from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+import asyncio
+import hashlib
+import os
+import time
+from llm.usage import llm_call
+
+# Replace the LLM with a deterministic offline stub, for replayed ingests and benchmarks
+LLM_STUB = os.getenv("LLM_STUB", "").lower() in ("1", "true", "yes")
+# Simulated latency of one stub call, in seconds
+LLM_STUB_LATENCY = float(os.getenv("LLM_STUB_LATENCY", "0"))
+
+# The stub has its own model name, so its results never share cache entries with the real model
+MODEL_NAME = "stub" if LLM_STUB else "gpt-4o"
+
+OPERATING_HOURS_PROMPT = """
+    You are given a list of outlets with their operating hours description. 
+    Please extract the opening and closing time of each outlet for each day of the week.
+    Return the times in HH:MM format.
+    <outlets_with_operating_hours_description>
+    {outlets_with_operating_hours_description}
+    </outlets_with_operating_hours_description>
+    """
+
+# Bump to invalidate cached results when the output changes without the prompt text changing
+PROMPT_REVISION = 1
+
+# Identifies the model and prompt that produced a result, cached results from other versions are discarded
+PROMPT_VERSION = hashlib.sha256(f"{MODEL_NAME}|{PROMPT_REVISION}|{OPERATING_HOURS_PROMPT}".encode()).hexdigest()[:16]
 
 class ProcessedOutletOperatingHours(BaseModel):
     outlet_id: str = Field(..., description="Outlet ID")
@@ -28,26 +57,63 @@ class OutletOperatingHoursDescription(BaseModel):
 class ProcessedOutput(BaseModel):
     processed_outlets_operating_hour: list[ProcessedOutletOperatingHours]
 
-def preprocess_data(outlets_operating_hours: list[OutletOperatingHoursDescription]) -> list[ProcessedOutletOperatingHours]:
-    llm = ChatOpenAI(temperature=0, model="gpt-4o")
+def stub_hours(description: OutletOperatingHoursDescription) -> ProcessedOutletOperatingHours:
+    """Parsed hours when the rule-based parser understands the description, otherwise hours derived from its hash"""
+    from data_ingest.op_hours_parser import parse_operating_hours
+
+    record = parse_operating_hours(description.outlet_id, description.operating_hours)
+    if record is not None:
+        return record
+    if not description.operating_hours:
+        return ProcessedOutletOperatingHours(outlet_id=description.outlet_id)
+
+    digest = hashlib.sha256(description.operating_hours.encode()).digest()
+    opening, closing = f"{7 + digest[0] % 4:02d}:{digest[1] % 2 * 30:02d}", f"{20 + digest[2] % 4:02d}:00"
+    days = ["mon", "tue", "wed", "thu", "fri", "sat", "sun", "public_holiday"]
+    return ProcessedOutletOperatingHours(
+        outlet_id=description.outlet_id,
+        **{f"{day}_{edge}": value for day in days for edge, value in (("open", opening), ("close", closing))}
+    )
+
+def stub_processor(inputs: dict) -> ProcessedOutput:
+    time.sleep(LLM_STUB_LATENCY)
+    return ProcessedOutput(processed_outlets_operating_hour=[
+        stub_hours(description) for description in inputs["outlets_with_operating_hours_description"]
+    ])
+
+async def astub_processor(inputs: dict) -> ProcessedOutput:
+    await asyncio.sleep(LLM_STUB_LATENCY)
+    return ProcessedOutput(processed_outlets_operating_hour=[
+        stub_hours(description) for description in inputs["outlets_with_operating_hours_description"]
+    ])
+
+def build_processor():
+    if LLM_STUB:
+        return RunnableLambda(stub_processor, afunc=astub_processor)
+
+    llm = ChatOpenAI(temperature=0, model=MODEL_NAME)
     structured_llm_operating_hours_processor = llm.with_structured_output(ProcessedOutput)  # Use ProcessedOutput
 
     # Define Prompt
-    prompt = """
-    You are given a list of outlets with their operating hours description. 
-    Please extract the opening and closing time of each outlet for each day of the week.
-    Return the times in HH:MM format.
-    <outlets_with_operating_hours_description>
-    {outlets_with_operating_hours_description}
-    </outlets_with_operating_hours_description>
-    """
     structured_llm_operating_hours_prompt = ChatPromptTemplate.from_messages(
-        [("system", prompt)]
+        [("system", OPERATING_HOURS_PROMPT)]
     )
 
     # Define Context Preparer
-    processor = structured_llm_operating_hours_prompt | structured_llm_operating_hours_processor
+    return structured_llm_operating_hours_prompt | structured_llm_operating_hours_processor
+
+def preprocess_data(outlets_operating_hours: list[OutletOperatingHoursDescription]) -> list[ProcessedOutletOperatingHours]:
+    processor = build_processor()
+
+    with llm_call("operating_hours") as config:
+        response = processor.invoke({"outlets_with_operating_hours_description": outlets_operating_hours}, config=config)
+
+    return response.processed_outlets_operating_hour
+
+async def apreprocess_data(outlets_operating_hours: list[OutletOperatingHoursDescription]) -> list[ProcessedOutletOperatingHours]:
+    processor = build_processor()
 
-    response = processor.invoke({"outlets_with_operating_hours_description": outlets_operating_hours})
+    with llm_call("operating_hours") as config:
+        response = await processor.ainvoke({"outlets_with_operating_hours_description": outlets_operating_hours}, config=config)
 
     return response.processed_outlets_operating_hour
@@ -0,0 +1,58 @@
+"""
+Latency, model request and token metrics of the LLM backed operations: operating hours
+normalization during ingest and QA agent runs.
+"""
+import time
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from metrics import LLM_CALL_SECONDS, LLM_MODEL_CALLS, LLM_TOKENS
+
+
+def token_usage(response: LLMResult) -> Tuple[int, int]:
+    """(input, output) tokens of a model response, 0 when the model did not report them"""
+    input_tokens = output_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            input_tokens += usage.get("input_tokens", 0)
+            output_tokens += usage.get("output_tokens", 0)
+    if not (input_tokens or output_tokens):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        input_tokens, output_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return input_tokens, output_tokens
+
+
+class UsageCallback(BaseCallbackHandler):
+    """Counts the model requests and tokens of one operation"""
+
+    # only adds to counters, no need to hand it to a thread when the operation runs async
+    run_inline = True
+
+    def __init__(self, call: str):
+        self.call = call
+
+    def on_llm_end(self, response: LLMResult, **kwargs):
+        LLM_MODEL_CALLS.inc(call=self.call, outcome="ok")
+        input_tokens, output_tokens = token_usage(response)
+        LLM_TOKENS.inc(input_tokens, call=self.call, direction="input")
+        LLM_TOKENS.inc(output_tokens, call=self.call, direction="output")
+
+    def on_llm_error(self, error: BaseException, **kwargs):
+        LLM_MODEL_CALLS.inc(call=self.call, outcome="error")
+
+
+@contextmanager
+def llm_call(call: str) -> Iterator[dict]:
+    """
+    Times one operation by its outcome. Pass the yielded config to invoke (or stream) so that the
+    operation's model requests and tokens are counted too.
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield {"callbacks": [UsageCallback(call)]}
+        outcome = "ok"
+    finally:
+        LLM_CALL_SECONDS.observe(time.perf_counter() - started, call=call, outcome=outcome)
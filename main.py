@@ -1,71 +1,266 @@
-from fastapi import Depends, FastAPI
+import asyncio
+import json
+import os
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from sqlmodel import Session, select
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
-from datetime import datetime, timedelta
-from data_ingest.ingester import ingest_data
+from datetime import datetime
+from typing import Optional
+from data_ingest.status import ingest_status
 from db import get_db, get_session, engine
-from llm.llm import QAAgent
-from models.models import Outlet, LatestUpdatedTimestamp
+from models.models import Outlet
 from dto.outlets import OutletInfoDTO
-from data_ingest.preprocess_op_hours import preprocess_op_hours
+from cache import ResponseCache, set_caches_generation
+from index.opening_hours import local_now, to_local
+from index.outlet_index import FIELDS, MAP_FIELDS, get_outlet_index
+from snapshot import build_outlets_snapshot
+from leader import INGEST_INTERVAL, Coordinator, latest_generation, latest_update
+from limiter import ConcurrencyLimiter, QueueFull
+from metrics import Collected, MetricsMiddleware, render as render_metrics
+from profiler import profile
 
 scheduler = BackgroundScheduler()
+# Only the worker holding the leader lock scrapes and ingests, the others refresh their caches
+coordinator = Coordinator(scheduler, engine)
+outlets_cache = ResponseCache(build_outlets_snapshot, warm=True)
+# Agent runs take tens of seconds; bound how many run at once and how many may wait
+qa_limiter = ConcurrencyLimiter(
+    "qa",
+    max_concurrency=int(os.getenv("QA_MAX_CONCURRENCY", "4")),
+    max_queue=int(os.getenv("QA_MAX_QUEUE", "16"))
+)
+# Exposes POST /debug/profile, which samples the stacks of every thread of the worker
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "").lower() in ("1", "true", "yes")
+
+Collected(
+    "qa_requests", "QA agent runs in progress and waiting for a slot", "gauge",
+    lambda: {("running",): qa_limiter.active, ("queued",): qa_limiter.waiting}, ("state",)
+)
+Collected("ingest_leader", "1 if this worker schedules ingest", "gauge", lambda: {(): int(coordinator.lock.held)})
+Collected(
+    "qa_rejected_requests_total", "QA requests turned away because the queue was full", "counter",
+    lambda: {(): qa_limiter.rejected}
+)
 
-def should_ingest(session: Session) -> bool:
-    """Check if ingest_data should be triggered based on timestamp."""
-    record = session.exec(select(LatestUpdatedTimestamp).order_by(LatestUpdatedTimestamp.timestamp.desc())).first()
-    if not record or (datetime.utcnow() - datetime.fromisoformat(record.timestamp)) > timedelta(hours=24):
-        return True
-    return False
-
-def schedule_job():
-    scheduler.add_job(
-        ingest_data,
-        IntervalTrigger(hours=24),  # Run every 24 hours
-        id="scrape_subway_outlet_data",
-        replace_existing=True
-    )
-    scheduler.start()
-    print("Scheduler started...")
-            
 async def app_lifespan(app: FastAPI):
     # Initialize the database
     get_db() 
-    # Run the scheduler when the app starts
-    with Session(engine) as session:
-        if should_ingest(session): # Start an initial ingestion if it hasn't been done in the last 24 hours
-            ingest_data()
-        schedule_job()
+    # The caches are built from this generation or a newer one, polling refreshes them after later ingests
+    set_caches_generation(latest_generation(engine))
+    # Load the outlet snapshot, the read endpoints below never query the database
+    get_outlet_index()
+    # Every worker coordinates, only the one holding the leader lock schedules ingest
+    coordinator.lead = app.state.schedule_ingest
+    coordinator.start()
+    scheduler.start()
+    print(f"Scheduler started ({coordinator.role})...")
     yield  
     # Shut down the scheduler when the app is shutting down
     scheduler.shutdown() 
+    coordinator.stop()
     print("Scheduler shut down...")
 
 # Define app
 app = FastAPI(lifespan=app_lifespan)
+app.add_middleware(MetricsMiddleware)
+# api.py turns this off, ingest then runs in worker.py
+app.state.schedule_ingest = True
 
-@app.get("/outlets")
-async def get_outlets(session: Session = Depends(get_session)) -> OutletInfoDTO:
-    outlets = session.exec(select(Outlet)).all()
-    latest_updated_timestamp = session.exec(select(LatestUpdatedTimestamp)).first()
+@app.get("/outlets", response_model=OutletInfoDTO)
+async def get_outlets(request: Request) -> Response:
+    # pre-encoded at ingest time; honours If-None-Match and Accept-Encoding
+    return outlets_cache.get().to_response(request.headers)
+
+# The snapshot endpoints return plain dicts of built-in types, skip FastAPI's jsonable_encoder pass
+def parse_fields(fields: Optional[str], default: tuple) -> tuple:
+    """Comma-separated outlet fields to return, a subset of FIELDS"""
+    if not fields:
+        return default
+    requested = tuple(name.strip() for name in fields.split(",") if name.strip())
+    unknown = [name for name in requested if name not in FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields {unknown}, choose from {list(FIELDS)}")
+    return requested
+
+@app.get("/outlets/nearest")
+async def get_nearest_outlets(
+    lat: float = Query(ge=-90, le=90),
+    lon: float = Query(ge=-180, le=180),
+    k: int = Query(5, ge=1, le=100),
+    fields: Optional[str] = None
+):
+    """The k outlets closest to a coordinate, closest first"""
+    index = get_outlet_index()
+    fields = parse_fields(fields, MAP_FIELDS + ("address",))
+    positions, distances = index.nearest_positions(lat, lon, k)
+    outlets = [{**index.project(i, fields), "distance_km": round(float(d), 3)} for i, d in zip(positions, distances)]
+    return JSONResponse({"last_updated": index.generation, "outlets": outlets})
+
+@app.get("/outlets/bbox")
+async def get_outlets_in_viewport(
+    south: float = Query(ge=-90, le=90),
+    west: float = Query(ge=-180, le=180),
+    north: float = Query(ge=-90, le=90),
+    east: float = Query(ge=-180, le=180),
+    limit: int = Query(500, ge=1, le=5000),
+    fields: Optional[str] = None
+):
+    """Outlets inside a map viewport. Beyond `limit`, an evenly spread subset is returned and `truncated` is set."""
+    if south > north:
+        raise HTTPException(status_code=400, detail="south must not be greater than north")
+    index = get_outlet_index()
+    fields = parse_fields(fields, MAP_FIELDS)
+    positions, count = index.viewport(south, west, north, east, limit)
+    return JSONResponse({
+        "last_updated": index.generation,
+        "count": count,
+        "truncated": count > limit,
+        "outlets": [index.project(i, fields) for i in positions]
+    })
+
+@app.get("/outlets/page")
+async def get_outlets_page(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = None
+):
+    """A page of outlets with the requested fields; `last_updated` changes when a later page comes from a newer ingest"""
+    index = get_outlet_index()
+    fields = parse_fields(fields, FIELDS)
+    return JSONResponse({
+        "last_updated": index.generation,
+        "total": len(index),
+        "offset": offset,
+        "outlets": [index.project(i, fields) for i in range(offset, min(offset + limit, len(index)))]
+    })
+
+@app.get("/outlets/search")
+async def search_outlets(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=100),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    fields: Optional[str] = None
+):
+    """Outlets matching `q` by name or address, typos tolerated; lat/lon boost nearby outlets"""
+    index = get_outlet_index()
+    fields = parse_fields(fields, MAP_FIELDS + ("address",))
+    outlets = []
+    for i, score, distance in index.search_matches(q, limit, lat, lon):
+        outlet = {**index.project(i, fields), "score": round(score, 3)}
+        if distance is not None:
+            outlet["distance_km"] = round(distance, 3)
+        outlets.append(outlet)
+    return JSONResponse({"last_updated": index.generation, "query": q, "outlets": outlets})
+
+@app.get("/outlets/open")
+async def get_open_outlets(at: Optional[datetime] = None, public_holiday: bool = False):
+    """Outlets open at `at` (ISO 8601, naive times are in TIMEZONE), now if not given"""
+    when = to_local(at) if at else local_now()
+    outlets = get_outlet_index().open_at(when, public_holiday)
+    return {"at": when.isoformat(), "count": len(outlets), "outlets": outlets}
 
-    return {
-        "outlets": outlets,
-        "last_updated": latest_updated_timestamp.timestamp if latest_updated_timestamp else None
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and its event loop is responsive"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: there is persisted outlet data to serve. Also reports its age and ingest progress."""
+    body = {
+        "ready": False, "last_updated": None, "data_age_seconds": None, "stale": None,
+        "leader": coordinator.lock.held, "ingest": ingest_status.snapshot()
     }
+    try:
+        with Session(engine) as session:
+            updated_at = latest_update(session)
+    except Exception as e:
+        body["error"] = f"Database unavailable: {e}"
+        return JSONResponse(body, status_code=503)
+    if updated_at is not None:
+        age = datetime.now() - updated_at
+        body.update(
+            ready=True,
+            last_updated=updated_at.isoformat(),
+            data_age_seconds=int(age.total_seconds()),
+            stale=age > INGEST_INTERVAL
+        )
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics of this worker process"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.post("/debug/profile")
+async def debug_profile(seconds: float = Query(10, gt=0, le=120), interval_ms: float = Query(10, ge=1, le=1000)):
+    """Sample every thread's stack for `seconds`, returned as collapsed stacks for a flame graph"""
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    stacks = await asyncio.to_thread(profile, seconds, interval_ms / 1000)
+    if stacks is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return PlainTextResponse(stacks)
 
 class QAInput(BaseModel):
     query: str
     
+@app.exception_handler(QueueFull)
+async def queue_full(request: Request, error: QueueFull) -> JSONResponse:
+    status = error.limiter.status()
+    return JSONResponse(
+        {"detail": str(error), **status},
+        status_code=503,
+        headers={"Retry-After": "5", "X-Queue-Depth": str(status["queued"])}
+    )
+
+def get_qa_agent():
+    """The QA agent singleton; langchain is imported and the agent built on the first QA request, not at startup"""
+    from llm.llm import QAAgent
+    return QAAgent()
+
 @app.post("/qa")
 async def qa(input: QAInput):
-    qa_agent = QAAgent()
-    return {"answer" : qa_agent.invoke(input.query)}
+    async with qa_limiter.slot():
+        # building the agent connects to the database, keep that off the event loop too
+        qa_agent = await asyncio.to_thread(get_qa_agent)
+        return {"answer" : await qa_agent.ainvoke(input.query)}
+
+@app.post("/qa/stream")
+async def qa_stream(input: QAInput) -> StreamingResponse:
+    """Server-sent events: tool_start, tool_end and token while the agent runs, then answer (or error)"""
+    # take the slot before responding, so a full queue is still a plain 503
+    slot = await qa_limiter.acquire()
+
+    async def events():
+        try:
+            qa_agent = await asyncio.to_thread(get_qa_agent)
+            async for event in qa_agent.astream(input.query):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        finally:
+            slot.release()
+
+    # the background task also releases the slot when the client disconnects before the stream starts
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(slot.release)
+    )
+
+@app.get("/qa/status")
+async def qa_status():
+    return qa_limiter.status()
 
 @app.get("/test")
 def get_distance_between_two_outlets(session: Session = Depends(get_session)):
+    from data_ingest.preprocess_op_hours import preprocess_op_hours
     # get all outlets
     outlets = session.exec(select(Outlet)).all()
 
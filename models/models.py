@@ -1,4 +1,4 @@
-from datetime import time as dt_time
+from datetime import datetime, time as dt_time
 from sqlmodel import TEXT, Column, Relationship, SQLModel, Field
 from typing import List, Optional
 
@@ -53,6 +53,12 @@ class LatestUpdatedTimestamp(SQLModel, table=True):
     id: int = Field(default=None, primary_key=True)  
     timestamp: str
 
+class OverlapSettings(SQLModel, table=True):
+    """The catchment radius and distance method the persisted overlaps were computed with"""
+    id: int = Field(default=None, primary_key=True)
+    radius_km: float
+    method: str = Field(max_length=32)
+
 class OutletOperatingHours(SQLModel, table=True):
     id: int = Field(default=None, primary_key=True)
     outlet_id: str = Field(foreign_key="outlet.id")
@@ -79,3 +85,9 @@ class OutletOperatingHours(SQLModel, table=True):
     public_holiday_open: dt_time | None = Field(None, description="Public holiday opening time (HH:MM format)")
     public_holiday_close: dt_time | None = Field(None, description="Public holiday closing time (HH:MM format)")
 
+
+class OperatingHoursCache(SQLModel, table=True):
+    key: str = Field(primary_key=True, max_length=64, description="SHA-256 of the prompt version and normalized operating hours")
+    prompt_version: str = Field(max_length=16, index=True)
+    hours: str = Field(sa_column=Column(TEXT), description="JSON of the processed opening and closing times")
+    last_used_at: datetime = Field(index=True)
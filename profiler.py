@@ -0,0 +1,79 @@
+"""
+Sampling profiler that can be switched on in a running process, for finding where time goes under
+real load without restarting under a profiler.
+
+A background thread records the stack of every other thread every `interval` seconds. The result
+is in the collapsed stack format ("frame;frame;frame count" per line) read by flamegraph.pl and
+speedscope. Sampling only reads frames, the profiled threads are not slowed down beyond the GIL
+the sampler takes for each sample.
+"""
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+
+def _stack(frame) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+class SamplingProfiler:
+    """One profile at a time per process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.samples: Counter = Counter()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float = 0.01) -> bool:
+        """Start sampling; False if a profile is already running"""
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self.samples = Counter()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self) -> str:
+        """Stop sampling and return the collapsed stacks, most sampled first"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+    def _run(self, interval: float):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                self.samples[f"{names.get(ident, ident)};{_stack(frame)}"] += 1
+
+
+profiler = SamplingProfiler()
+
+
+def profile(seconds: float, interval: float = 0.01) -> Optional[str]:
+    """Sample for `seconds` and return the collapsed stacks; None if a profile is already running"""
+    if not profiler.start(interval):
+        return None
+    time.sleep(seconds)
+    return profiler.stop()
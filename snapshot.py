@@ -0,0 +1,102 @@
+import gzip
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, Mapping, Optional
+from fastapi import Response
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, select
+from db import engine
+from dto.outlets import OutletInfoDTO
+from models.models import LatestUpdatedTimestamp, Outlet
+
+# brotli is optional, without it clients are served gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Quality value of each coding in an Accept-Encoding header, lower-cased; q=0 means refused"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.lower()] = quality
+    return accepted
+
+
+@dataclass(frozen=True)
+class EncodedResponse:
+    """A JSON response encoded once, in every content encoding we serve"""
+    etag: str
+    identity: bytes
+    gzip: bytes
+    br: Optional[bytes]
+
+    @classmethod
+    def encode(cls, body: bytes, version: str) -> "EncodedResponse":
+        # weak ETag: the compressed variants are not byte-identical to each other
+        etag = f'W/"{hashlib.sha256(version.encode()).hexdigest()[:20]}"'
+        return cls(
+            etag=etag,
+            identity=body,
+            gzip=gzip.compress(body, compresslevel=9),
+            br=brotli.compress(body, quality=11) if brotli else None
+        )
+
+    def not_modified(self, if_none_match: Optional[str]) -> bool:
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or any(tag.removeprefix("W/") == self.etag.removeprefix("W/") for tag in tags)
+
+    def to_response(self, headers: Mapping[str, str]) -> Response:
+        """Serve the pre-encoded bytes, or a 304 when the client already has this version"""
+        response_headers = {"ETag": self.etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+        if self.not_modified(headers.get("if-none-match")):
+            return Response(status_code=304, headers=response_headers)
+
+        accepted = accepted_encodings(headers.get("accept-encoding", ""))
+        # codings that are not listed get the quality of "*", if any
+        quality = {coding: accepted.get(coding, accepted.get("*", 0.0)) for coding in ("br", "gzip")}
+        if self.br is None:
+            quality["br"] = 0.0
+        # the client's preference first, brotli on a tie
+        coding = max(("br", "gzip"), key=lambda coding: quality[coding])
+        if quality[coding] > 0:
+            body, response_headers["Content-Encoding"] = (self.br if coding == "br" else self.gzip), coding
+        else:
+            body = self.identity
+        return Response(content=body, media_type="application/json", headers=response_headers)
+
+
+def build_outlets_snapshot() -> EncodedResponse:
+    """Build the /outlets payload with the overlapping relationships eager-loaded (4 queries in total)"""
+    with Session(engine) as session:
+        latest_updated_timestamp = session.exec(select(LatestUpdatedTimestamp)).first()
+        # both sides of each overlap resolve from the session's identity map, since every outlet is loaded here
+        outlets = session.exec(
+            select(Outlet).options(
+                selectinload(Outlet.overlapping_as_outlet1),
+                selectinload(Outlet.overlapping_as_outlet2),
+            )
+        ).all()
+        timestamp = latest_updated_timestamp.timestamp if latest_updated_timestamp else None
+
+        response = OutletInfoDTO.model_validate({
+            "outlets": outlets,
+            "last_updated": timestamp
+        }, from_attributes=True)
+
+    # the ETag only changes when ingest writes a new timestamp
+    return EncodedResponse.encode(response.model_dump_json().encode(), timestamp or "")
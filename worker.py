@@ -0,0 +1,31 @@
+"""
+Standalone ingest worker, for running the API with api.py:
+
+    python worker.py
+
+Competes for the same leader lock as the API workers, so running several (or main.py next to it)
+still ingests once per generation. Only the leader scrapes; the others wait to take over.
+"""
+from apscheduler.schedulers.blocking import BlockingScheduler
+from db import engine, get_db
+from leader import Coordinator
+
+
+def main():
+    get_db()
+    scheduler = BlockingScheduler()
+    # no in-process caches to refresh, the API workers pick the new generation up themselves
+    coordinator = Coordinator(scheduler, engine, refresh=False)
+    coordinator.start()
+    print(f"Ingest worker started ({coordinator.role})...")
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        coordinator.stop()
+        print("Ingest worker shut down...")
+
+
+if __name__ == "__main__":
+    main()